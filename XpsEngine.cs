@@ -66,8 +66,9 @@ namespace XPSUI
             dynamic sys = Py.Import("sys");
             string exeDir = AppDomain.CurrentDomain.BaseDirectory;
             string pyDir = Path.Combine(exeDir, "python");
-            sys.path.append(exeDir);
-            sys.path.append(pyDir);
+            // 2回目以降の呼び出しで sys.path が伸び続けないよう、未登録の場合だけ追加する
+            if (!(bool)sys.path.__contains__(exeDir)) sys.path.append(exeDir);
+            if (!(bool)sys.path.__contains__(pyDir)) sys.path.append(pyDir);
         }
 
         // --- 2. データ読み込み ---
@@ -76,8 +77,9 @@ namespace XPSUI
             using (Py.GIL())
             {
                 PreparePythonEnvironment();
-                dynamic xpsasc = Py.Import("XPSASC");
-                dynamic result = xpsasc.load_allspe(filePath);
+                // 同じファイルの再読み込みはキャッシュ(XPSCACHE)から開く
+                dynamic xpscache = Py.Import("XPSCACHE");
+                dynamic result = xpscache.load_allspe_cached(filePath);
 
                 var pyTags = result[0];
                 var pyX = result[1];
@@ -149,21 +151,21 @@ namespace XPSUI
             {
                 PreparePythonEnvironment();
 
-                dynamic xpscal = Py.Import("XPSCAL");
-                dynamic xpsfit = Py.Import("XPSFIT");
-                dynamic json = Py.Import("json");
-                dynamic np = Py.Import("numpy");
+                dynamic xpssession = Py.Import("XPSSESSION");
+                dynamic xpsconfig = Py.Import("XPSCONFIG");
+
+                // RSF.json / peakfit.json は XPSCONFIG が検証・タグ別に索引化して保持する (更新されたときだけ読み直す)
+                dynamic config = xpsconfig.get_config(FindConfigPath("RSF.json"), FindConfigPath("peakfit.json"));
+
+                // バックグラウンドはセッション内で1回だけ計算し、Atomic % と Fitting で共有する
+                // (fit_cache=true: 前回から変更の無い領域はフィット結果キャッシュから返す)
+                dynamic session = xpssession.AnalysisSession(Tags, XData, YData, true);
 
                 // ① Atomic % 計算
-                var atomicPercents = CalculateAtomicPercents(xpscal, json);
+                var atomicPercents = CalculateAtomicPercents(session, config);
 
-                // PeakDBロード
-                dynamic peakDb = null;
-                string peakFitPath = FindConfigPath("peakfit.json");
-                if (File.Exists(peakFitPath))
-                {
-                    peakDb = json.loads(File.ReadAllText(peakFitPath));
-                }
+                // PeakDB が読み込めたか (peakfit.json が無い場合はフィッティングしない)
+                bool hasPeakDb = (bool)config.has_peak_db;
 
                 // ② タグごとに処理
                 for (int i = 0; i < Tags.Count; i++)
@@ -186,10 +188,10 @@ namespace XPSUI
                     // スキップ条件 (Python仕様準拠)
                     if (i == 0) continue;          // Survey (Su1s) はスキップ
                     if (tag == "CuLMM") continue;  // CuLMM はスキップ
-                    if (peakDb == null) continue;
+                    if (!hasPeakDb) continue;
 
                     // Fitting実行
-                    var fitRows = PerformPeakFitting(i, peakDb, xpscal, xpsfit, np);
+                    var fitRows = PerformPeakFitting(i, config, session);
                     rows.AddRange(fitRows);
                 }
             }
@@ -197,25 +199,13 @@ namespace XPSUI
         }
 
         // --- ヘルパー: Atomic % 計算 ---
-        private List<double> CalculateAtomicPercents(dynamic xpscal, dynamic json)
+        private List<double> CalculateAtomicPercents(dynamic session, dynamic config)
         {
             var results = new List<double>();
             try
             {
-                string rsfPath = FindConfigPath("RSF.json");
-                dynamic rsfList = new PyList();
-
-                if (File.Exists(rsfPath))
-                {
-                    try
-                    {
-                        string rsfContent = File.ReadAllText(rsfPath);
-                        rsfList = json.loads(rsfContent);
-                    }
-                    catch { }
-                }
-
-                dynamic apResult = xpscal.atomic_percent(XData, YData, Tags, rsfList);
+                // タグ -> RSF の辞書 (RSF.json が無い・壊れている場合は空)
+                dynamic apResult = session.atomic_percent(config.rsf);
 
                 long count = apResult.__len__();
                 for (int i = 0; i < count; i++)
@@ -241,32 +231,20 @@ namespace XPSUI
         }
 
         // --- ヘルパー: Peak Fitting ---
-        private List<AnalysisResultRow> PerformPeakFitting(int index, dynamic peakDb, dynamic xpscal, dynamic xpsfit, dynamic np)
+        private List<AnalysisResultRow> PerformPeakFitting(int index, dynamic config, dynamic session)
         {
             var fitRows = new List<AnalysisResultRow>();
             try
             {
                 string tag = Tags[index];
-                dynamic targetConfig = new PyList();
-                foreach (dynamic p in peakDb)
-                {
-                    if (p["level"].ToString() == tag) targetConfig.append(p);
-                }
+                // タグ別の索引から取り出す (ピークDB全体を走査しない)
+                dynamic targetConfig = config.peaks_for(tag);
 
                 if (targetConfig.__len__() > 0)
                 {
-                    // 1. バックグラウンド
-                    dynamic bgRes = xpscal.shirley_baseline(XData[index], YData[index]);
-                    dynamic yBg = bgRes[0];
-
-                    // 2. NumPy計算 & マイナスカット
-                    dynamic yRaw = np.array(YData[index]);
-                    dynamic yBase = np.array(yBg);
-                    dynamic yPure = np.subtract(yRaw, yBase);
-                    yPure = np.maximum(yPure, 0.0);
-
-                    // 3. Fitting
-                    dynamic fitRes = xpsfit.perform_fitting(XData[index], yPure, targetConfig, false);
+                    // バックグラウンド差し引き済み(マイナスカット)の強度でFitting
+                    // (セッションがShirleyの範囲±1eVの点だけでフィットし、波形・面積は全点で返す)
+                    dynamic fitRes = session.fit(index, targetConfig, false);
 
                     if (fitRes != null && fitRes[0] != null)
                     {
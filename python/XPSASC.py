@@ -1,10 +1,247 @@
 #XPS ASC2コンバーター
 import csv
+import os
+import time
+import warnings
 import numpy as np
 
-def load_allspe(path):
+import XPSPROF
+
+from XPSSPEC import SpectrumSet
+
+
+def load_allspe(path, as_set=False):
     """
     指定されたパスのCSVファイルを読み込み、タグとデータをリストで返す関数
+    高速パーサー(load_allspe_fast)を優先し、扱えないファイルは従来のcsvパーサーで読む
+    as_set: True の場合は (tags, x_list, y_list) の代わりに XPSSPEC.SpectrumSet を返す
+    """
+    if as_set:
+        return SpectrumSet.from_lists(*load_allspe(path))
+
+    start = time.perf_counter() if XPSPROF.enabled else None
+    parser = "fast"
+    try:
+        result = load_allspe_fast(path)
+    except FileNotFoundError:
+        print("ファイルが見つかりませんでした。")
+        return [], [], []
+    except Exception:
+        result = None
+
+    if result is None:
+        parser = "csv"
+        result = load_allspe_csv(path)
+
+    if start is not None:
+        XPSPROF.record("load", time.perf_counter() - start, file=os.path.basename(path), parser=parser,
+                       regions=len(result[0]), points=int(sum(len(x) for x in result[1])))
+    return result
+
+
+def load_allspe_fast(path):
+    """
+    ファイル全体を一度に読み込み、区切り/タグ行の位置からブロックを求め、
+    各ブロックの数値をNumPyで一括変換する高速パーサー
+    戻り値は load_allspe_csv と同じ (tags, x_list, y_list)
+    クォート等でcsvと同じ解釈が保証できない場合は None を返す
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read()
+
+    # csvモジュール固有の解釈が必要な文字があれば従来パーサーに任せる
+    if '"' in text or '\x00' in text:
+        return None
+
+    buf = text.encode('utf-8')
+    raw = np.frombuffer(buf, dtype=np.uint8)
+
+    # 1. 行インデックス (各行の開始/終了バイト位置)
+    newlines = np.flatnonzero(raw == ord('\n'))
+    line_start = np.concatenate(([0], newlines + 1))
+    line_end = np.append(newlines, len(buf))
+    if line_start[-1] == len(buf):
+        line_start = line_start[:-1]
+        line_end = line_end[:-1]
+
+    # 2. 行の分類 (カンマ数 0: 区切り/ヘッダー行, 1: データ行, 2以上: 無視)
+    commas = np.flatnonzero(raw == ord(','))
+    n_commas = np.searchsorted(commas, line_end) - np.searchsorted(commas, line_start)
+    is_sep = (n_commas == 0)
+    data_idx = np.flatnonzero(n_commas == 1)
+
+    if len(data_idx) == 0:
+        return [], [], []
+
+    # カンマの前後がすべて数値の文字なら空の列は無い (ある場合だけブロックごとに詳しく調べる)
+    check_empty = not _commas_between_numbers(raw, commas)
+
+    # 3. ブロック境界: 直前の区切り行の個数が変わる所で分割
+    block_id = np.cumsum(is_sep)[data_idx]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(block_id)) + 1))
+    ends = np.append(starts[1:], len(data_idx))
+
+    # 4. タグ行の位置と名前 (区切り行のみをデコード)
+    tag_pos = []
+    tag_names = []
+    for i in np.flatnonzero(is_sep):
+        name = buf[line_start[i]:line_end[i]].decode('utf-8').strip()
+        if name not in ['1', '']:
+            tag_pos.append(i)
+            tag_names.append(name)
+    tag_pos = np.array(tag_pos, dtype=np.int64)
+
+    # 5. ブロックごとに数値を一括変換
+    tags = []
+    all_data_x = []
+    all_data_y = []
+    for s, e in zip(starts, ends):
+        first = data_idx[s]
+        last = data_idx[e - 1]
+        if last - first + 1 == e - s:
+            # データ行が連続している場合はバイト範囲をそのまま変換
+            chunk = buf[line_start[first]:line_end[last]]
+        else:
+            chunk = b'\n'.join(buf[line_start[i]:line_end[i]] for i in data_idx[s:e])
+
+        values = _parse_block(chunk, e - s, check_empty)
+        if len(values) == 0:
+            continue
+
+        k = np.searchsorted(tag_pos, first) - 1
+        tags.append(tag_names[k] if k >= 0 else "Unknown")
+        all_data_x.append(values[:, 0].copy())
+        all_data_y.append(values[:, 1].copy())
+
+    return tags, all_data_x, all_data_y
+
+
+def _parse_block(chunk, n_lines, check_empty=True):
+    """
+    "x,y" 行の並び(bytes)を (n, 2) の配列に変換する
+    数値でない行・空の列がある行が混ざっている場合は、その行だけを読み飛ばして変換し直す
+    check_empty: False は空の列が無いことを呼び出し側で確認済みの場合
+    """
+    # np.fromstring は空の列を警告なしで -1.0 にしてしまうため、空の列がある場合は一括変換しない
+    values = None if check_empty and _has_empty_field(chunk) else _fromstring(chunk)
+
+    if values is not None and len(values) == 2 * n_lines:
+        return values.reshape(-1, 2)
+
+    # 従来パーサーと同様に float() で変換できない行を除外する
+    kept = [line for line in chunk.decode('utf-8').split('\n') if _is_data_line(line)]
+    if len(kept) == 0:
+        return np.empty((0, 2))
+    return np.array([[float(a), float(b)] for a, b in (line.split(',') for line in kept)])
+
+
+# 数値に使われる文字 (カンマの前後がこれ以外なら空の列の可能性がある)
+_NUMERIC_CHARS = np.zeros(256, dtype=bool)
+_NUMERIC_CHARS[np.frombuffer(b'0123456789.+-eE', dtype=np.uint8)] = True
+
+
+def _commas_between_numbers(raw, commas):
+    """すべてのカンマの直前・直後が数値の文字か (raw: ファイル全体のバイト列, commas: カンマの位置)"""
+    if len(commas) == 0:
+        return True
+    if commas[0] == 0 or commas[-1] == len(raw) - 1:
+        return False
+    return bool(_NUMERIC_CHARS[raw[commas - 1]].all() and _NUMERIC_CHARS[raw[commas + 1]].all())
+
+
+def _has_empty_field(chunk):
+    """空の列 ("1," / ",2" / "1, ," など空白だけの列を含む) があるか"""
+    packed = chunk.translate(None, b' \t\r')
+    return (b',\n' in packed or b'\n,' in packed or b',,' in packed
+            or packed.startswith(b',') or packed.endswith(b','))
+
+
+def _fromstring(chunk):
+    """np.fromstring で一括変換する (変換できない文字がある場合は None)"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(chunk.replace(b'\n', b','), dtype=np.float64, sep=',')
+        except (DeprecationWarning, ValueError):
+            return None
+
+
+def _is_data_line(line):
+    """データ行として float() 変換できるかを判定"""
+    try:
+        a, b = line.split(',')
+        float(a)
+        float(b)
+        return True
+    except ValueError:
+        return False
+
+
+def iter_allspe(path, block_lines=None):
+    """
+    ファイルを先頭から順に読み、領域ごとに (tag, x, y) を返すジェネレーター
+    ファイル全体を保持しないため、メモリ使用量は1領域分で頭打ちになる
+    戻り値の並びと内容は load_allspe と同じ
+    block_lines: 1領域がこの行数を超えたら途中でも数値化しておく (None の場合は領域ごと)
+    """
+    data_lines = []   # 未変換のデータ行
+    converted = []    # 変換済みの (n, 2) 配列
+    current_tag = "Unknown"
+
+    def flush():
+        if len(data_lines) > 0:
+            converted.append(_parse_block('\n'.join(data_lines).encode('utf-8'), len(data_lines)))
+            data_lines.clear()
+        values = np.concatenate(converted) if len(converted) > 1 else (converted[0] if converted else None)
+        converted.clear()
+        return values
+
+    try:
+        f = open(path, 'r', encoding='utf-8', errors='replace')
+    except FileNotFoundError:
+        print("ファイルが見つかりませんでした。")
+        return
+
+    with f:
+        for line in f:
+            line = line.rstrip('\n')
+            if '"' in line:
+                # クォートを含む行は csv と同じ規則で列に分ける
+                row = next(csv.reader([line]), [])
+                n_fields = len(row)
+                if n_fields == 2:
+                    line = ','.join(row)
+            else:
+                n_fields = line.count(',') + 1 if line != '' else 0
+
+            # --- データ行 (2列) ---
+            if n_fields == 2:
+                data_lines.append(line)
+                if block_lines is not None and len(data_lines) >= block_lines:
+                    converted.append(_parse_block('\n'.join(data_lines).encode('utf-8'), len(data_lines)))
+                    data_lines.clear()
+
+            # --- 区切り/ヘッダー行 ---
+            elif n_fields <= 1:
+                values = flush()
+                if values is not None and len(values) > 0:
+                    yield current_tag, values[:, 0].copy(), values[:, 1].copy()
+
+                name = line.strip() if n_fields == 1 else ''
+                if '"' in line:
+                    name = row[0].strip() if n_fields == 1 else ''
+                if name not in ['1', '']:
+                    current_tag = name
+
+        # --- 最後のブロック ---
+        values = flush()
+        if values is not None and len(values) > 0:
+            yield current_tag, values[:, 0].copy(), values[:, 1].copy()
+
+
+def load_allspe_csv(path):
+    """
+    csv.reader で1行ずつ読み込む従来のパーサー (不正な形式のファイル用のフォールバック)
     """
     all_data_x = []
     all_data_y = []
@@ -22,11 +259,13 @@ def load_allspe(path):
             for row in reader:
                 # --- データ行 (2列) ---
                 if len(row) == 2:
+                    # 両方変換できた行だけを追加する (片方だけ追加すると x と y の点数がずれる)
                     try:
-                        temp_x.append(float(row[0]))
-                        temp_y.append(float(row[1]))
+                        x_value, y_value = float(row[0]), float(row[1])
                     except ValueError:
                         continue
+                    temp_x.append(x_value)
+                    temp_y.append(y_value)
 
                 # --- 区切り/ヘッダー行 ---
                 elif len(row) <= 1:
@@ -52,4 +291,4 @@ def load_allspe(path):
 
     except FileNotFoundError:
         print("ファイルが見つかりませんでした。")
-        return [], [], []
\ No newline at end of file
+        return [], [], []
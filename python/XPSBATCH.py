@@ -0,0 +1,207 @@
+#一括解析 (フォルダ内のASCファイルをまとめて処理)
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import XPSASC
+import XPSCAL
+import XPSCONFIG
+import XPSOUTPUTPQ
+import XPSOUTPUTXL
+import XPSPROF
+from XPSSESSION import AnalysisSession
+
+# 既定の設定フォルダ (C#側の FindConfigPath と同じ場所)
+DEFAULT_SETTING_DIR = XPSCONFIG.DEFAULT_SETTING_DIR
+
+
+def load_json(path, default=None):
+    """JSONファイルを読み込む (存在しない・壊れている場合は default を返す)"""
+    try:
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def analyze_file(path, rsf_list, peak_db, shift_setting=None, output_dir=None, parquet_dir=None, profile=False):
+    """
+    1ファイル分の 読み込み → 帯電補正 → Atomic % / Fitting → Excel出力 を行う
+    shift_setting: {"XMin", "XMax", "ShiftPeakCenter"} (shift_setting.json と同じ形式)。None なら補正しない
+    parquet_dir: 指定した場合は XPSOUTPUTPQ のデータセットにも追加する (試料名はファイル名)
+    profile: True の場合は XPSPROF で各処理を計測し、summary["profile"] に report を入れる
+    戻り値: 結果をまとめた辞書 (プロセス間で受け渡せるよう配列は含めない)
+    """
+    start = time.perf_counter()
+    summary = {"file": path, "status": "ok", "tags": [], "atomic_percent": [], "components": []}
+    if profile:
+        XPSPROF.enable()
+
+    try:
+        tags, x_list, y_list = XPSASC.load_allspe(path)
+        if len(tags) == 0:
+            summary["status"] = "no data"
+            return summary
+
+        # 帯電補正 (C1sが無い場合などは補正なしで続行)
+        if shift_setting is not None:
+            with XPSPROF.stage("shift"):
+                shifted = XPSCAL.shift(
+                    tags, x_list, y_list,
+                    shift_setting.get("XMin", 280.0), shift_setting.get("XMax", 290.0),
+                    shift_setting.get("ShiftPeakCenter", 284.4)
+                )
+            if isinstance(shifted, tuple):
+                x_list, y_list = shifted
+
+        session = AnalysisSession(tags, x_list, y_list)
+        with XPSPROF.stage("analysis", regions=len(tags)):
+            atomic, fit_results_list = session.run_analysis(rsf_list, peak_db)
+
+        base = os.path.splitext(os.path.basename(path))[0]
+        if output_dir is not None:
+            save_path = os.path.join(output_dir, base + ".xlsx")
+            XPSOUTPUTXL.export_to_excel(save_path, tags, session.x_list, session.y_list, fit_results_list, atomic)
+            summary["excel"] = save_path
+
+        if parquet_dir is not None:
+            with XPSPROF.stage("parquet"):
+                XPSOUTPUTPQ.export_to_parquet(parquet_dir, base, tags, session.x_list, session.y_list, fit_results_list, atomic)
+
+        summary["tags"] = list(tags)
+        summary["atomic_percent"] = [float(v) for v in atomic]
+        for tag, res in zip(tags, fit_results_list):
+            if res is None:
+                continue
+            for peak in res["peaks"]:
+                summary["components"].append({
+                    "tag": tag,
+                    "name": peak["name"],
+                    "center": float(peak["center"]),
+                    "fwhm": float(peak["fwhm"]),
+                    "area": float(peak["area"]),
+                    "ratio": float(peak["ratio"]),
+                })
+
+    except Exception as e:
+        summary["status"] = f"error: {e}"
+    finally:
+        if profile:
+            summary["profile"] = XPSPROF.report()
+            XPSPROF.disable()
+
+    summary["elapsed"] = time.perf_counter() - start
+    return summary
+
+
+def run_batch(paths, rsf_list, peak_db, shift_setting=None, output_dir=None, workers=None, parquet_dir=None,
+              profile=False):
+    """
+    複数ファイルをプロセスプールで並列に解析し、終わった順に結果(analyze_fileの戻り値)を返すジェネレーター
+    workers: 並列数 (None の場合はCPUコア数)
+    """
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    if workers == 1:
+        for path in paths:
+            yield analyze_file(path, rsf_list, peak_db, shift_setting, output_dir, parquet_dir, profile)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(analyze_file, path, rsf_list, peak_db, shift_setting, output_dir, parquet_dir, profile)
+            for path in paths
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def write_summary(results, save_path):
+    """
+    全ファイルの結果を1つのExcelにまとめる
+    Atomic_Percent: ファイル x タグ の表 / Fit_Result: 成分ごとの一覧
+    """
+    import pandas as pd
+
+    atomic_rows = []
+    fit_rows = []
+    for res in sorted(results, key=lambda r: r["file"]):
+        row = {"File": os.path.basename(res["file"]), "Status": res["status"]}
+        for tag, value in zip(res["tags"], res["atomic_percent"]):
+            if value > 0:
+                row[tag] = value
+        atomic_rows.append(row)
+
+        for comp in res["components"]:
+            fit_rows.append({
+                "File": os.path.basename(res["file"]),
+                "Spectrum": comp["tag"],
+                "Component Name": comp["name"],
+                "Area Ratio (%)": comp["ratio"],
+                "Position (eV)": comp["center"],
+                "FWHM (eV)": comp["fwhm"],
+                "Area": comp["area"],
+            })
+
+    with pd.ExcelWriter(save_path, engine='openpyxl') as writer:
+        pd.DataFrame(atomic_rows).to_excel(writer, sheet_name="Atomic_Percent", index=False)
+        pd.DataFrame(fit_rows).to_excel(writer, sheet_name="Fit_Result", index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="フォルダ内のASCファイルを一括解析します")
+    parser.add_argument("input_dir", help="ASCファイルのあるフォルダ")
+    parser.add_argument("-o", "--output", default=None, help="出力フォルダ (既定: input_dir/batch_result)")
+    parser.add_argument("--pattern", default="*.asc", help="対象ファイルのパターン")
+    parser.add_argument("--setting-dir", default=DEFAULT_SETTING_DIR, help="RSF.json / peakfit.json / shift_setting.json のフォルダ")
+    parser.add_argument("--no-shift", action="store_true", help="帯電補正を行わない")
+    parser.add_argument("--no-excel", action="store_true", help="ファイルごとのExcel出力を行わない")
+    parser.add_argument("--parquet", default=None, help="Parquetデータセットの出力フォルダ (指定時のみ出力)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="並列数 (既定: CPUコア数)")
+    parser.add_argument("--profile", default=None, help="各処理の計測結果 (JSON) の保存先 (指定時のみ計測)")
+    args = parser.parse_args(argv)
+
+    paths = sorted(glob.glob(os.path.join(args.input_dir, args.pattern)))
+    if len(paths) == 0:
+        print("対象ファイルが見つかりませんでした。")
+        return 1
+
+    output_dir = args.output or os.path.join(args.input_dir, "batch_result")
+    os.makedirs(output_dir, exist_ok=True)
+
+    # RSF / ピーク設定は検証してタグごとの索引にしたものを各プロセスに渡す
+    config = XPSCONFIG.get_config(setting_dir=args.setting_dir)
+    rsf_list = config.rsf
+    peak_db = config.peaks if config.peak_db is not None else None
+    shift_setting = None
+    if not args.no_shift:
+        shift_setting = load_json(os.path.join(args.setting_dir, "shift_setting.json"), {})
+
+    start = time.perf_counter()
+    results = []
+    excel_dir = None if args.no_excel else output_dir
+    profile = args.profile is not None
+    for res in run_batch(paths, rsf_list, peak_db, shift_setting, excel_dir, args.workers, args.parquet, profile):
+        results.append(res)
+        print(f"[{len(results)}/{len(paths)}] {os.path.basename(res['file'])}: {res['status']} ({res.get('elapsed', 0.0):.2f} s)")
+
+    summary_path = os.path.join(output_dir, "batch_summary.xlsx")
+    write_summary(results, summary_path)
+
+    if profile:
+        # ファイルごとの計測結果と全ファイルの集計を保存する
+        reports = {res["file"]: res.pop("profile", None) for res in results}
+        total = XPSPROF.merge_reports(reports.values())
+        with open(args.profile, 'w', encoding='utf-8') as f:
+            json.dump({"total": total, "files": reports}, f, ensure_ascii=False, indent=2)
+        print(XPSPROF.format_report(total))
+    print(f"完了: {len(results)} ファイル, {time.perf_counter() - start:.1f} s -> {summary_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
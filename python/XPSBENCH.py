@@ -0,0 +1,261 @@
+#ベンチマーク (合成スペクトルで各処理の時間とメモリを計測し、JSONで出力する)
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+import XPSASC
+import XPSCAL
+import XPSFIT
+from XPSSESSION import AnalysisSession
+
+# 合成する領域 (タグ, 中心の結合エネルギー)。先頭はSurvey扱い (フィッティング対象外)
+REGIONS = [("Su1s", 500.0), ("C1s", 284.8), ("O1s", 531.5), ("N1s", 399.9), ("Si2p", 99.3),
+           ("F1s", 686.0), ("S2p", 164.0), ("Cl2p", 199.0), ("Cu2p", 932.6), ("CuLMM", 568.0)]
+RSF = {"C1s": 0.314, "O1s": 0.733, "N1s": 0.499, "Si2p": 0.368, "F1s": 1.0, "S2p": 0.717, "Cl2p": 0.954, "Cu2p": 5.321}
+
+PEAK_SPACING = 1.5  # 成分の間隔 (eV)
+SCENARIOS = ("load", "shirley", "fit", "atomic_percent", "export_excel", "pipeline")
+
+
+# --- 1. 合成データ ---
+def make_spectrum(center, points=2000, peaks=2, noise=0.02, step=0.3, width=20.0, rng=None):
+    """
+    1領域分の合成スペクトル (x は結合エネルギーの昇順) を返す
+    (build_fit_results の面積は台形積分の符号をそのまま使うため、降順にすると全成分の面積が0になる)
+    peaks: 成分数 (center から PEAK_SPACING ずつ高エネルギー側に並べる)
+    noise: ピーク高さに対するノイズの標準偏差 / step: ピーク高さに対するShirley型の段差
+    戻り値: (x, y, 各成分の真値 [{"center", "fwhm", "height"}])
+    """
+    rng = rng if rng is not None else np.random.default_rng(0)
+    x = np.linspace(center - width / 2, center + width / 2, points)
+
+    signal = np.zeros(points)
+    truth = []
+    for k in range(peaks):
+        c = center + k * PEAK_SPACING
+        fwhm = 1.2 + 0.2 * k
+        height = 5000.0 / (k + 1)
+        sigma = fwhm / (2 * np.sqrt(2 * np.log(2)))
+        gauss = np.exp(-(x - c) ** 2 / (2 * sigma ** 2))
+        lorentz = 1.0 / (1.0 + ((x - c) / (fwhm / 2)) ** 2)
+        signal += height * (0.7 * gauss + 0.3 * lorentz)
+        truth.append({"center": c, "fwhm": fwhm, "height": height})
+
+    # Shirley型の段差: 低エネルギー側から積分したピーク強度に比例して高エネルギー側が持ち上がる
+    integral = np.cumsum(signal)
+    background = 1000.0 + step * 5000.0 * integral / max(integral[-1], 1e-12)
+
+    y = background + signal + rng.normal(0.0, noise * 5000.0, points)
+    return x, y, truth
+
+
+def generate_asc(path, n_regions=5, points=2000, peaks=2, noise=0.02, step=0.3, seed=0):
+    """
+    load_allspe で読める形式の合成ASCファイルを書き出す (同じ引数なら同じ内容)
+    戻り値: 書き出した領域の情報 [{"tag", "center", "peaks": 真値}]
+    """
+    rng = np.random.default_rng(seed)
+    regions = [REGIONS[i % len(REGIONS)] for i in range(n_regions)]
+    info = []
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        for tag, center in regions:
+            x, y, truth = make_spectrum(center, points, peaks, noise, step, rng=rng)
+            f.write(f"{tag}\n1\n")
+            f.write("\n".join(f"{a:.3f},{b:.4f}" for a, b in zip(x, y)))
+            f.write("\n\n")
+            info.append({"tag": tag, "center": center, "peaks": truth})
+    return info
+
+
+def make_settings(info):
+    """generate_asc の戻り値から、合成データに合う (rsf_list, peak_db) を作る (peak_db は PeakFitEditor と同じ形式)"""
+    rsf_list = [{"level": tag, "rsf": rsf} for tag, rsf in RSF.items()]
+    peak_db = []
+    seen = set()
+    for region in info:
+        if region["tag"] in seen:
+            continue
+        seen.add(region["tag"])
+        for k, p in enumerate(region["peaks"]):
+            peak_db.append({"level": region["tag"], "name": f"{region['tag']}-{k + 1}",
+                            "center": round(p["center"] + 0.2, 2), "center_error": 0.5,
+                            "FWHM": round(p["fwhm"] * 1.1, 2), "FWHM_error": round(p["fwhm"] * 0.5, 2)})
+    return rsf_list, peak_db
+
+
+def check_results(atomic, fits):
+    """
+    解析結果が計測に使える内容か確認する (Atomic % とフィット成分の面積がすべて0なら RuntimeError)
+    面積が0のままだと時間は測れても Excel 出力などが実際とは違う処理になるため
+    """
+    if not any(a > 0 for a in atomic):
+        raise RuntimeError("Atomic % がすべて0です。データまたは RSF の設定を確認してください。")
+    areas = [p["area"] for res in fits if res is not None for p in res["peaks"]]
+    if areas and not any(a > 0 for a in areas):
+        raise RuntimeError("フィット成分の面積がすべて0です。エネルギー軸の向きを確認してください。")
+
+
+# --- 2. 計測 ---
+def time_call(func, repeat=3, memory=False):
+    """
+    func() を repeat 回実行し、経過時間 (秒) を返す
+    memory=True の場合は別に1回 tracemalloc 付きで実行し、ピークのメモリ使用量 (MB) も返す
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    result = {"times": times, "best": min(times), "median": float(np.median(times))}
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def run_scenarios(path, rsf_list, peak_db, scenarios=SCENARIOS, repeat=3, memory=False, work_dir=None):
+    """
+    ASCファイル1つに対して各処理の時間を計測する
+    戻り値: {シナリオ名: {"times", "best", "median", "points_per_s", ("peak_mb")}}
+    """
+    tags, x_list, y_list = XPSASC.load_allspe(path)
+    n_points = int(sum(len(x) for x in x_list))
+    fit_targets = [i for i, tag in enumerate(tags)
+                   if i != 0 and tag != "CuLMM" and any(p["level"] == tag for p in peak_db)]
+    work_dir = work_dir or tempfile.mkdtemp(prefix="xpsbench_")
+
+    def run_load():
+        XPSASC.load_allspe(path)
+
+    def run_shirley():
+        for x, y in zip(x_list, y_list):
+            XPSCAL.shirley_baseline(x, y)
+
+    session = AnalysisSession(tags, x_list, y_list)
+    nets = {i: session.background(i)["y_net"] for i in fit_targets}
+
+    def run_fit():
+        for i in fit_targets:
+            XPSFIT.perform_fitting(x_list[i], nets[i], [p for p in peak_db if p["level"] == tags[i]])
+
+    def run_atomic():
+        XPSCAL.atomic_percent(x_list, y_list, tags, rsf_list)
+
+    atomic, fits = session.run_analysis(rsf_list, peak_db)
+    check_results(atomic, fits)
+
+    def run_export():
+        import XPSOUTPUTXL
+        XPSOUTPUTXL.export_to_excel(os.path.join(work_dir, "bench.xlsx"), tags, x_list, y_list, fits, atomic)
+
+    def run_pipeline():
+        import XPSOUTPUTXL
+        t, x, y = XPSASC.load_allspe(path)
+        shifted = XPSCAL.shift(t, x, y, 280.0, 290.0)
+        if isinstance(shifted, tuple):
+            x, y = shifted
+        s = AnalysisSession(t, x, y)
+        a, f = s.run_analysis(rsf_list, peak_db)
+        XPSOUTPUTXL.export_to_excel(os.path.join(work_dir, "pipeline.xlsx"), t, s.x_list, s.y_list, f, a)
+
+    funcs = {"load": run_load, "shirley": run_shirley, "fit": run_fit, "atomic_percent": run_atomic,
+             "export_excel": run_export, "pipeline": run_pipeline}
+
+    results = {}
+    for name in scenarios:
+        if name not in funcs:
+            raise ValueError(f"不明なシナリオです: {name}")
+        res = _quiet(time_call, funcs[name], repeat, memory)
+        res["points_per_s"] = n_points / res["best"] if res["best"] > 0 else None
+        results[name] = res
+    return results
+
+
+def benchmark(n_regions=5, points=2000, peaks=2, noise=0.02, step=0.3, seed=0,
+              scenarios=SCENARIOS, repeat=3, memory=False, path=None, rsf_list=None, peak_db=None):
+    """
+    合成データ (または path の実データ) で全シナリオを計測し、JSONにできる辞書を返す
+    path を指定した場合は rsf_list, peak_db も渡す (省略時は合成データ用の設定)
+    """
+    work_dir = tempfile.mkdtemp(prefix="xpsbench_")
+    try:
+        params = {"n_regions": n_regions, "points": points, "peaks": peaks, "noise": noise, "step": step, "seed": seed}
+        if path is None:
+            path = os.path.join(work_dir, "synthetic.asc")
+            info = generate_asc(path, n_regions, points, peaks, noise, step, seed)
+            default_rsf, default_peaks = make_settings(info)
+            rsf_list = rsf_list if rsf_list is not None else default_rsf
+            peak_db = peak_db if peak_db is not None else default_peaks
+        else:
+            params = {"file": os.path.abspath(path)}
+
+        results = run_scenarios(path, rsf_list or [], peak_db or [], scenarios, repeat, memory, work_dir)
+        return {
+            "params": params,
+            "file_bytes": os.path.getsize(path),
+            "repeat": repeat,
+            "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                            "platform": platform.platform(), "cpus": os.cpu_count()},
+            "results": results,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _quiet(func, *args):
+    """計測中は各関数の print を止める"""
+    import contextlib
+    import io
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="XPS解析の各処理の時間を計測します")
+    parser.add_argument("--regions", type=int, default=5, help="領域数")
+    parser.add_argument("--points", type=int, default=2000, help="1領域の点数")
+    parser.add_argument("--peaks", type=int, default=2, help="1領域の成分数")
+    parser.add_argument("--noise", type=float, default=0.02, help="ノイズ (ピーク高さに対する比)")
+    parser.add_argument("--step", type=float, default=0.3, help="Shirley型の段差 (ピーク高さに対する比)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--file", default=None, help="合成データの代わりに使うASCファイル")
+    parser.add_argument("--setting-dir", default=None, help="--file 使用時の RSF.json / peakfit.json のフォルダ")
+    parser.add_argument("-s", "--scenario", action="append", choices=SCENARIOS, help="計測するシナリオ (複数指定可)")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="各シナリオの実行回数")
+    parser.add_argument("--memory", action="store_true", help="ピークメモリ使用量も計測する (tracemalloc)")
+    parser.add_argument("-o", "--output", default=None, help="結果のJSONの保存先 (省略時は標準出力)")
+    args = parser.parse_args(argv)
+
+    rsf_list = peak_db = None
+    if args.file is not None:
+        import XPSCONFIG
+        config = XPSCONFIG.get_config(setting_dir=args.setting_dir)
+        rsf_list, peak_db = config.rsf_list, config.peak_db
+
+    report = benchmark(args.regions, args.points, args.peaks, args.noise, args.step, args.seed,
+                       args.scenario or SCENARIOS, args.repeat, args.memory, args.file, rsf_list, peak_db)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        for name, res in report["results"].items():
+            print(f"{name:<16}{res['best'] * 1000:>10.1f} ms" + (f"{res['peak_mb']:>10.1f} MB" if "peak_mb" in res else ""))
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
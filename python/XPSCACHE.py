@@ -0,0 +1,207 @@
+#スペクトルキャッシュ (読み込み済みASCをバイナリで保存し、再オープンを高速化)
+import hashlib
+import json
+import os
+import numpy as np
+
+import XPSASC
+from XPSSPEC import SpectrumSet
+
+# 既定のキャッシュ保存先 (C#側の設定フォルダ XPSUI_setting と同じ場所)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), "Documents", "XPSUI_setting", "cache")
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB (キャッシュフォルダ全体の上限)
+
+# キャッシュフォルダ内のサブフォルダ (XPSSTACK のスタック, XPSFITCACHE のフィット結果)
+# スペクトルのエントリと合わせてフォルダ全体で1つの上限を共有する (evict_cache)
+CACHE_SUBDIRS = ("stacks", "fits")
+
+# ヒット/ミスの集計 (get_cache_stats で参照)
+cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def load_allspe_cached(path, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, as_set=False):
+    """
+    load_allspe のキャッシュ付き版 (戻り値は同じ (tags, x_list, y_list))
+    1回目は解析結果を .npy (2 x 全点数) + .json (タグ/オフセット) として保存し、
+    2回目以降はサイズと更新時刻(またはファイルのハッシュ)が一致すればメモリマップで開く
+    as_set: True の場合は XPSSPEC.SpectrumSet を返す (キャッシュヒット時はメモリマップをそのまま使う)
+    max_bytes: キャッシュフォルダ全体 (stacks / fits を含む) の上限
+    """
+    cache_dir = _resolve_cache_dir(cache_dir)
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return XPSASC.load_allspe(path, as_set=as_set)
+
+    key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+    meta_path = os.path.join(cache_dir, key + ".json")
+    data_path = os.path.join(cache_dir, key + ".npy")
+
+    # --- 1. キャッシュ確認 ---
+    meta = _read_meta(meta_path)
+    if meta is not None and meta.get("size") == st.st_size:
+        valid = meta.get("mtime_ns") == st.st_mtime_ns
+        if not valid and meta.get("sha1") == _file_digest(path):
+            # コピー等で更新時刻だけ変わった場合は中身のハッシュで判定
+            meta["mtime_ns"] = st.st_mtime_ns
+            _write_meta(meta_path, meta)
+            valid = True
+
+        if valid:
+            result = _open_entry(meta, data_path, as_set)
+            if result is not None:
+                os.utime(meta_path)  # LRU用に最終使用時刻を更新
+                cache_stats["hits"] += 1
+                return result
+
+    # --- 2. キャッシュミス: 通常通り読み込んで保存 ---
+    cache_stats["misses"] += 1
+    tags, x_list, y_list = XPSASC.load_allspe(path)
+    if len(tags) == 0:
+        return SpectrumSet.from_lists(tags, x_list, y_list) if as_set else (tags, x_list, y_list)
+
+    try:
+        _write_entry(cache_dir, key, path, st, tags, x_list, y_list, max_bytes)
+    except OSError as e:
+        print(f"キャッシュの保存に失敗しました: {e}")
+
+    if as_set:
+        return SpectrumSet.from_lists(tags, x_list, y_list)
+    return tags, x_list, y_list
+
+
+def get_cache_stats():
+    """ヒット/ミス/削除数のコピーを返す"""
+    return dict(cache_stats)
+
+
+def clear_cache(cache_dir=None):
+    """キャッシュフォルダ直下のスペクトルのエントリをすべて削除する (stacks / fits はそのまま)"""
+    cache_dir = _resolve_cache_dir(cache_dir)
+    return evict_lru(cache_dir, 0)
+
+
+def evict_cache(cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    キャッシュフォルダ全体 (スペクトル + CACHE_SUBDIRS) の合計サイズを max_bytes 以下にする
+    どのフォルダのエントリかに関係なく、最終使用時刻の古いものから削除する。削除したエントリ数を返す
+    """
+    return evict_lru(_resolve_cache_dir(cache_dir), max_bytes, CACHE_SUBDIRS)
+
+
+def evict_lru(cache_dir, max_bytes, subdirs=()):
+    """
+    フォルダ内のエントリ (同じファイル名幹の組) を最終使用時刻の古い順に削除し、
+    合計サイズを max_bytes 以下にする。削除したエントリ数を返す
+    subdirs: 一緒に数えるサブフォルダ名 (フォルダをまたいで1つの上限として古い順に削除する)
+    """
+    entries = {}
+    for folder in [cache_dir] + [os.path.join(cache_dir, d) for d in subdirs]:
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            full = os.path.join(folder, name)
+            if not os.path.isfile(full):
+                continue
+            stem = (folder, name.split('.', 1)[0])
+            st = os.stat(full)
+            size, last_used, files = entries.get(stem, (0, 0, []))
+            entries[stem] = (size + st.st_size, max(last_used, st.st_mtime), files + [full])
+
+    total = sum(e[0] for e in entries.values())
+    removed = 0
+    for size, _, files in sorted(entries.values(), key=lambda e: e[1]):
+        if total <= max_bytes:
+            break
+        for full in files:
+            try:
+                os.remove(full)
+            except OSError:
+                pass
+        total -= size
+        removed += 1
+
+    cache_stats["evictions"] += removed
+    return removed
+
+
+# --- ヘルパー ---
+def _resolve_cache_dir(cache_dir):
+    if cache_dir is None:
+        cache_dir = os.environ.get("XPSUI_CACHE_DIR", DEFAULT_CACHE_DIR)
+    return cache_dir
+
+
+def _file_digest(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+
+
+def _open_entry(meta, data_path, as_set=False):
+    """保存済みの配列をメモリマップで開き、領域ごとのビューに分割する"""
+    try:
+        data = np.load(data_path, mmap_mode='c')
+    except (OSError, ValueError):
+        return None
+
+    offsets = meta["offsets"]
+    if data.ndim != 2 or data.shape[1] != offsets[-1]:
+        return None
+
+    tags = list(meta["tags"])
+    if as_set:
+        return SpectrumSet(tags, data[0], data[1], offsets)
+
+    x_list = [data[0, offsets[i]:offsets[i + 1]] for i in range(len(tags))]
+    y_list = [data[1, offsets[i]:offsets[i + 1]] for i in range(len(tags))]
+    return tags, x_list, y_list
+
+
+def _write_entry(cache_dir, key, path, st, tags, x_list, y_list, max_bytes):
+    offsets = np.concatenate(([0], np.cumsum([len(x) for x in x_list]))).tolist()
+    if 2 * 8 * offsets[-1] > max_bytes:
+        return
+
+    os.makedirs(cache_dir, exist_ok=True)
+    data = np.empty((2, offsets[-1]), dtype=np.float64)
+    for i in range(len(tags)):
+        data[0, offsets[i]:offsets[i + 1]] = x_list[i]
+        data[1, offsets[i]:offsets[i + 1]] = y_list[i]
+
+    # 配列 -> メタ情報の順で書き込み (メタ情報があるエントリのみ有効)
+    data_path = os.path.join(cache_dir, key + ".npy")
+    tmp_path = data_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, data)
+    os.replace(tmp_path, data_path)
+
+    meta = {
+        "source": os.path.abspath(path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha1": _file_digest(path),
+        "tags": tags,
+        "offsets": offsets,
+    }
+    _write_meta(os.path.join(cache_dir, key + ".json"), meta)
+
+    evict_lru(cache_dir, max_bytes, CACHE_SUBDIRS)
@@ -0,0 +1,157 @@
+#設定レジストリ (RSF.json / peakfit.json を1回だけ読み込み、タグごとに索引を作る)
+import json
+import os
+
+# 既定の設定フォルダ (C#側の FindConfigPath と同じ場所)
+DEFAULT_SETTING_DIR = os.path.join(os.path.expanduser("~"), "Documents", "XPSUI_setting")
+
+# (RSFのパス, peakfitのパス) -> (ファイルの状態, AnalysisConfig)
+_registry = {}
+
+
+class AnalysisConfig:
+    """
+    検証済みの RSF とピーク設定を保持するクラス
+    rsf_list / peak_db: 元の形式 (JSONのリスト。peakfit.json が無い場合 peak_db は None)
+    rsf: タグ -> RSF の辞書 / peaks: タグ -> そのタグのピーク設定リスト の辞書
+    has_peak_db: peakfit.json を読み込めたか (C#側の判定用)
+    """
+
+    def __init__(self, rsf_list, peak_db):
+        self.rsf_list = validate_rsf(rsf_list)
+        self.peak_db = validate_peaks(peak_db) if peak_db is not None else None
+        self.has_peak_db = self.peak_db is not None
+        self.rsf = index_rsf(self.rsf_list)
+        self.peaks = index_peaks(self.peak_db)
+
+    def rsf_for(self, tag):
+        return self.rsf.get(tag, 0.0)
+
+    def peaks_for(self, tag):
+        """そのタグのピーク設定 (無い場合は空のリスト)"""
+        return self.peaks.get(tag, [])
+
+
+def get_config(rsf_path=None, peakfit_path=None, setting_dir=None):
+    """
+    RSF.json と peakfit.json から AnalysisConfig を返す
+    2回目以降はファイルの更新時刻・サイズが変わっていなければ前回の結果をそのまま返す
+    パスを省略した場合は setting_dir (既定: DEFAULT_SETTING_DIR) 内のファイルを使う
+    """
+    setting_dir = setting_dir or DEFAULT_SETTING_DIR
+    rsf_path = os.path.abspath(rsf_path or os.path.join(setting_dir, "RSF.json"))
+    peakfit_path = os.path.abspath(peakfit_path or os.path.join(setting_dir, "peakfit.json"))
+
+    key = (rsf_path, peakfit_path)
+    stamp = (_file_stamp(rsf_path), _file_stamp(peakfit_path))
+    cached = _registry.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    config = AnalysisConfig(_load_json(rsf_path, []), _load_json(peakfit_path, None))
+    _registry[key] = (stamp, config)
+    return config
+
+
+def get_shift_setting(setting_dir=None):
+    """setting_dir (既定: DEFAULT_SETTING_DIR) 内の shift_setting.json を辞書で返す (無ければ空の辞書)"""
+    setting_dir = setting_dir or DEFAULT_SETTING_DIR
+    return _load_json(os.path.join(setting_dir, "shift_setting.json"), {})
+
+
+def clear_registry():
+    """読み込み済みの設定を破棄する (次の get_config で読み直す)"""
+    _registry.clear()
+
+
+def index_rsf(rsf_list):
+    """RSF設定をタグ -> RSF の辞書にする (辞書 / AnalysisConfig を渡した場合はそのまま使う)"""
+    if isinstance(rsf_list, AnalysisConfig):
+        return rsf_list.rsf
+    if isinstance(rsf_list, dict):
+        return rsf_list
+    return {item["level"]: item["rsf"] for item in (rsf_list or [])}
+
+
+def index_peaks(peak_db):
+    """ピーク設定をタグ -> 設定リスト の辞書にする (辞書 / AnalysisConfig を渡した場合はそのまま使う)"""
+    if isinstance(peak_db, AnalysisConfig):
+        return peak_db.peaks
+    if isinstance(peak_db, dict):
+        return peak_db
+    peaks = {}
+    for p in (peak_db or []):
+        peaks.setdefault(p["level"], []).append(p)
+    return peaks
+
+
+def validate_rsf(rsf_list):
+    """level と 0以上の数値の rsf を持つ項目だけを残す (不正な項目は表示して除外)"""
+    valid = []
+    for i, item in enumerate(rsf_list or []):
+        try:
+            if not isinstance(item.get("level"), str) or float(item["rsf"]) < 0:
+                raise ValueError
+            valid.append(item)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            print(f"RSF設定の {i} 番目の項目が不正なため無視します: {item}")
+    return valid
+
+
+# PeakFitEditor (peakfit.json) のキー -> 解析側のキー
+PEAK_KEY_ALIASES = {"center": "position", "FWHM": "fwhm", "center_error": "position_error", "FWHM_error": "fwhm_error"}
+
+
+def normalize_peak(p):
+    """
+    ピーク設定1件を解析側のキー (position, fwhm, position_error, fwhm_error) を持つ辞書にして返す
+    PeakFitEditor の center, FWHM, center_error, FWHM_error はそれぞれ対応するキーに写す (元のキーも残す)
+    """
+    peak = dict(p)
+    for src, dst in PEAK_KEY_ALIASES.items():
+        if dst not in peak and src in peak:
+            peak[dst] = peak[src]
+    return peak
+
+
+def validate_peaks(peak_db):
+    """
+    level, name, position, 正の fwhm を持つ項目だけを残す (不正な項目は表示して除外)
+    PeakFitEditor の形式 (center, FWHM, center_error, FWHM_error) は normalize_peak で写してから検証する
+    """
+    valid = []
+    for i, p in enumerate(peak_db or []):
+        try:
+            if not isinstance(p.get("level"), str) or "name" not in p:
+                raise ValueError
+            peak = normalize_peak(p)
+            float(peak["position"])
+            if float(peak["fwhm"]) <= 0:
+                raise ValueError
+            for key in ("position_error", "fwhm_error"):
+                if key in peak and float(peak[key]) < 0:
+                    raise ValueError
+            valid.append(peak)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            print(f"ピーク設定の {i} 番目の項目が不正なため無視します: {p}")
+    return valid
+
+
+# --- ヘルパー ---
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _load_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            return json.load(f)
+    except OSError:
+        return default
+    except ValueError as e:
+        print(f"設定ファイルを読み込めませんでした ({os.path.basename(path)}): {e}")
+        return default
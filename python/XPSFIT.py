@@ -1,5 +1,10 @@
+import atexit
+import threading
+import time
 import numpy as np
-from scipy.optimize import curve_fit
+# scipy / プロセスプール / 共有メモリは使う関数の中で読み込む (import XPSFIT だけでは読み込まない)
+
+import XPSPROF
 
 # --- 1. フィッティング用関数定義 (Pseudo-Voigt) ---
 def pseudo_voigt(x, amp, center, fwhm, mix_ratio):
@@ -21,27 +26,182 @@ def pseudo_voigt(x, amp, center, fwhm, mix_ratio):
     return amp * ((1 - mix_ratio) * g + mix_ratio * l)
 
 # --- 2. 複数のピークを足し合わせるモデル関数 ---
+def peak_components(x, params):
+    """
+    全ピークを (ピーク数 x 点数) の配列として一括計算する
+    params: [amp, center, fwhm, mix] をピーク数分並べたもの
+    """
+    x = np.asarray(x, dtype=float)
+    p = np.asarray(params, dtype=float).reshape(-1, 4)
+    amp, cen, fwhm, mix = (p[:, k:k+1] for k in range(4))
+    return pseudo_voigt(x[None, :], amp, cen, fwhm, mix)
+
 def multi_peak_model(x, *params):
     """
     curve_fitに渡すための、全ピークの合計を返す関数
     """
-    y_sum = np.zeros_like(x)
-    num_peaks = len(params) // 4
-    
-    for i in range(num_peaks):
-        amp = params[i*4]
-        cen = params[i*4+1]
-        fwhm = params[i*4+2]
-        mix = params[i*4+3]
-        y_sum += pseudo_voigt(x, amp, cen, fwhm, mix)
-        
-    return y_sum
+    return peak_components(x, params).sum(axis=0)
+
+def multi_peak_jacobian(x, *params):
+    """
+    multi_peak_model の解析的ヤコビアン (点数 x パラメータ数)
+    列の順序は params と同じ (Amp, Center, FWHM, Mix) x ピーク数
+    """
+    x = np.asarray(x, dtype=float)
+    p = np.asarray(params, dtype=float).reshape(-1, 4)
+
+    jac = np.empty((x.size, p.size))
+    for k, deriv in enumerate(peak_derivatives(x, p)):
+        jac[:, k::4] = deriv.T
+    return jac
+
+def peak_derivatives(x, p):
+    """
+    各ピークの Amp, Center, FWHM, Mix での偏微分 (4つの配列) を返す
+    p: (..., ピーク数, 4) の配列。戻り値はそれぞれ (..., ピーク数, 点数)
+    (先頭の次元でスペクトルごとのパラメータをまとめて計算できる)
+    """
+    amp, cen, fwhm, mix = (p[..., k:k+1] for k in range(4))
+
+    sigma = fwhm / (2 * np.sqrt(2 * np.log(2)))
+    gamma = fwhm / 2.0
+
+    d = x - cen
+    g = np.exp(-(d**2) / (2 * sigma**2))
+    l = 1 / (1 + (d / gamma)**2)
+
+    # 各パラメータでの偏微分
+    d_amp = (1 - mix) * g + mix * l
+    d_cen = amp * ((1 - mix) * g * d / sigma**2 + mix * l**2 * 2 * d / gamma**2)
+    d_fwhm = amp * ((1 - mix) * g * d**2 / sigma**2 + mix * l**2 * 2 * d**2 / gamma**2) / fwhm
+    d_mix = amp * (l - g)
+    return d_amp, d_cen, d_fwhm, d_mix
 
 # --- 3. メインのフィッティング実行関数 ---
-def perform_fitting(x, y, config, verbose=False):
+# ROIで切り出すときに両側へ広げる幅 (eV)
+ROI_MARGIN = 1.0
+
+# 1回のフィッティングの関数評価回数の上限 (既定)
+DEFAULT_MAX_NFEV = 10000
+MIN_BOUND_WIDTH = 1e-3  # 誤差 0 の設定でも境界の下限 < 上限 にする (eV)
+
+
+class FitAborted(Exception):
+    """フィッティングを途中で打ち切った (reason: "timeout" = 時間切れ / "cancelled" = 中止)"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def peak_limits(peak_conf):
+    """
+    ピーク設定1件から (位置, 位置の下限, 上限, FWHM, FWHMの下限, 上限) を返す
+    position_error / fwhm_error (PeakFitEditor の center_error / FWHM_error) があればその幅で動かし、
+    無い場合は 位置±0.5eV, FWHM 0.5~1.5倍 とする (キーは XPSCONFIG.normalize_peak と同じく editor の形式も読む)
+    """
+    def value(key, alias, default=None):
+        v = peak_conf.get(key, peak_conf.get(alias, default))
+        if v is None:
+            raise KeyError(key)
+        return float(v)
+
+    pos = value("position", "center")
+    fwhm = value("fwhm", "FWHM")
+    pos_err = max(value("position_error", "center_error", 0.5), MIN_BOUND_WIDTH)
+    fwhm_err = peak_conf.get("fwhm_error", peak_conf.get("FWHM_error"))
+    if fwhm_err is None:
+        fwhm_min, fwhm_max = fwhm * 0.5, fwhm * 1.5
+    else:
+        fwhm_err = max(float(fwhm_err), MIN_BOUND_WIDTH)
+        fwhm_min, fwhm_max = max(fwhm - fwhm_err, fwhm * 0.1), fwhm + fwhm_err
+    return pos, pos - pos_err, pos + pos_err, fwhm, fwhm_min, fwhm_max
+
+
+def fit_window(x, y, roi=None, config=None, margin=ROI_MARGIN, reduce=False, stride=4, signal_frac=0.05, pad=3):
+    """
+    フィッティングに使う点の番号 (昇順) を返す
+    roi: (x_min, x_max) Shirleyの範囲。margin (eV) だけ広げ、config の各ピークが動ける範囲
+         (peak_limits の位置の範囲 ± FWHMの上限) も必ず含める
+    reduce: True の場合、信号の小さい点 (y < signal_frac * 最大値) は stride 点ごとに間引く
+            信号の大きい点とその前後 pad 点は全点残す
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    keep = np.ones(len(x), dtype=bool)
+    if roi is not None:
+        lo, hi = min(roi) - margin, max(roi) + margin
+        for peak_conf in config or []:
+            _, pos_min, pos_max, _, _, width = peak_limits(peak_conf)
+            lo = min(lo, pos_min - width)
+            hi = max(hi, pos_max + width)
+        keep = (x >= lo) & (x <= hi)
+
+    idx = np.flatnonzero(keep)
+    if reduce and len(idx) > 0:
+        y_win = y[idx]
+        strong = y_win >= signal_frac * np.max(y_win)
+        if pad > 0:
+            strong = np.convolve(strong, np.ones(2 * pad + 1), mode='same') > 0
+        sparse = np.zeros(len(idx), dtype=bool)
+        sparse[::stride] = True
+        sparse[-1] = True  # 端の点は残す
+        idx = idx[strong | sparse]
+    return idx
+
+def estimate_amplitudes(x, y, centers, fwhms, mix=0.3, floor=0.01):
+    """
+    中心と半値幅を固定したときの各ピークの強度 (amp) を非負の線形最小二乗 (NNLS) で求める
+    基底は高さ1の pseudo_voigt なので、重なったピークでも全体の形に合う強度の組が1回の計算で得られる
+    floor: 強度の下限 (yの最大値に対する比)。0 だと位置・幅の偏微分が消えて動かなくなるため
+    戻り値: 強度の配列 (ピーク数)
+    """
+    from scipy.optimize import nnls
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    params = np.column_stack([np.ones(len(centers)), centers, fwhms, np.full(len(centers), mix)])
+    basis = peak_components(x, params.ravel())  # (ピーク数 x 点数)
+
+    amps, _ = nnls(basis.T, y)
+    y_max = np.max(y) if len(y) > 0 else 0.0
+    return np.maximum(amps, floor * y_max)
+
+
+def _guess_amplitudes(x, y, centers, fwhms, mix, default, verbose=False):
+    """
+    estimate_amplitudes の結果を返す。NNLSが失敗した場合 (点数不足・NaN・収束しない など) は default をそのまま返す
+    """
+    try:
+        amps = estimate_amplitudes(x, y, centers, fwhms, mix=mix)
+        if len(amps) != len(default) or not np.all(np.isfinite(amps)):
+            raise ValueError("強度の推定値が不正です")
+        return amps
+    except (ValueError, RuntimeError, FloatingPointError, np.linalg.LinAlgError) as e:
+        if verbose: print(f"Amplitude Guess Error: {e}")
+        return np.asarray(default, dtype=float)
+
+def perform_fitting(x, y, config, verbose=False, use_jac=True, initial_params=None, info=None,
+                    auto_guess=False, roi=None, roi_margin=ROI_MARGIN, reduce_points=False,
+                    max_nfev=DEFAULT_MAX_NFEV, timeout=None, should_stop=None):
     """
     指定された範囲のデータ(x, y)に対し、configの設定に基づいてピーク分離を行う
     エラーが起きても停止せず、Noneを返して処理を継続させる
+    use_jac: True の場合は解析的ヤコビアンを使う (False で数値微分)
+    initial_params: 前回の結果から初期値を与える (ウォームスタート)
+                    fitted_peaks (結果の辞書リスト) または [amp, center, fwhm, mix] x ピーク数
+                    ピーク数が config と合わない場合は無視して通常の初期値を使う
+    info: 辞書を渡すと "nfev" (関数評価回数), "popt", "warm_start", "points" (フィットに使った点数) を書き込む
+    auto_guess: True の場合、強度の初期値を estimate_amplitudes (位置・幅を固定したNNLS) で決める
+                (ウォームスタートの初期値がある場合はそちらを優先)
+    roi: (x_min, x_max) を渡すと fit_window の範囲 (roi ± roi_margin) の点だけでフィットする
+    reduce_points: True の場合、信号の小さい点を間引いてフィットする (fit_window の reduce)
+    どちらの場合も、各ピークの波形と面積は元の x 全体で計算する
+    max_nfev: 関数評価回数の上限 / timeout: 経過時間の上限 (秒)
+    should_stop: 関数評価ごとに呼ぶ関数。True を返すとそこで打ち切る (別スレッドからの中止用)
+    打ち切った場合は失敗と同じく (None, None) を返し、info["aborted"] に "timeout" / "cancelled" を書き込む
+    (失敗した場合は info["error"] にその内容を書き込む)
     """
     # 1. 初期パラメータ作成
     try:
@@ -56,18 +216,11 @@ def perform_fitting(x, y, config, verbose=False):
 
         for peak_conf in config:
             # パラメータ読み込み (name, position, fwhm, etc...)
-            # ※ configの構造に合わせてキー名は適宜調整してください
+            # position / fwhm (editor の center / FWHM) と、誤差があればその範囲を境界にする
             p_name = peak_conf["name"]
             
-            # 位置 (center)
-            p_pos = float(peak_conf["position"])
-            p_pos_min = p_pos - 0.5 # ±0.5eV程度動けるとする
-            p_pos_max = p_pos + 0.5
-            
-            # FWHM (半値幅)
-            p_fwhm = float(peak_conf["fwhm"])
-            p_fwhm_min = p_fwhm * 0.5
-            p_fwhm_max = p_fwhm * 1.5
+            # 位置 (center) と FWHM (半値幅)
+            p_pos, p_pos_min, p_pos_max, p_fwhm, p_fwhm_min, p_fwhm_max = peak_limits(peak_conf)
             
             # 強度 (Amplitude) - 初期値は適当、範囲は0〜無限大
             # 簡易的にyの最大値を参考にしても良い
@@ -92,38 +245,88 @@ def perform_fitting(x, y, config, verbose=False):
         # 境界条件リスト作成
         bounds_list = (bounds_min, bounds_max)
 
+        # フィットに使う点 (ROIの外の平坦な部分を除く)
+        x_fit, y_fit = x, y
+        if roi is not None or reduce_points:
+            idx = fit_window(x, y, roi, peak_infos, roi_margin, reduce_points)
+            if len(idx) >= 5:
+                x_fit = np.asarray(x, dtype=float)[idx]
+                y_fit = np.asarray(y, dtype=float)[idx]
+
+        # ウォームスタート: 前回の収束値を境界内に収めて初期値にする
+        warm = _warm_start_params(initial_params, len(peak_infos))
+        if warm is not None:
+            initial_guess = list(np.clip(warm, bounds_min, bounds_max))
+        elif auto_guess and len(peak_infos) > 0:
+            # 強度の初期値: 設定位置・幅で形を固定して線形に当てはめる
+            guess = np.asarray(initial_guess, dtype=float).reshape(-1, 4)
+            # 推定に失敗した場合は既定の強度 (yの最大値の半分) のまま
+            guess[:, 0] = _guess_amplitudes(x_fit, y_fit, guess[:, 1], guess[:, 2], guess[0, 3], guess[:, 0], verbose)
+            initial_guess = list(np.clip(guess.ravel(), bounds_min, bounds_max))
+
     except Exception as e:
         if verbose: print(f"Config Error: {e}")
         return None, None
 
     # 2. フィッティング実行 (ここが一番落ちやすいのでガードする)
+    from scipy.optimize import curve_fit
+    start = time.perf_counter() if XPSPROF.enabled else None
+    model, jac = multi_peak_model, multi_peak_jacobian if use_jac else None
+    if timeout is not None or should_stop is not None:
+        model, jac = _limited(model, jac, timeout, should_stop)
     try:
-        popt, pcov = curve_fit(
-            multi_peak_model, 
-            x, 
-            y, 
+        popt, pcov, infodict, _, _ = curve_fit(
+            model, 
+            x_fit, 
+            y_fit, 
             p0=initial_guess, 
             bounds=bounds_list, 
-            maxfev=10000 # 試行回数を少し増やす
+            jac=jac,
+            maxfev=max_nfev, # 試行回数を少し増やす (既定 10000)
+            full_output=True
         )
+        if info is not None:
+            info["nfev"] = int(infodict["nfev"])
+            info["popt"] = popt
+            info["warm_start"] = warm is not None
+            info["points"] = len(x_fit)
+        if start is not None:
+            XPSPROF.record("fit", time.perf_counter() - start, points=len(x_fit), peaks=len(peak_infos),
+                           nfev=int(infodict["nfev"]), success=True, warm_start=warm is not None)
     except Exception as e:
         # RuntimeError (収束せず) や OptimizeWarning (共分散なし) など
         if verbose: print(f"Fitting Failed: {e}")
+        if info is not None:
+            info["error"] = f"{type(e).__name__}: {e}"
+            if isinstance(e, FitAborted):
+                info["aborted"] = e.reason
+        if start is not None:
+            XPSPROF.record("fit", time.perf_counter() - start, points=len(x_fit), peaks=len(peak_infos),
+                           success=False, error=type(e).__name__)
         return None, None
 
-    # 3. 結果整理 (Excel出力用に構造を変えない)
+    # 3. 結果整理 (Excel出力用に構造を変えない。波形・面積は元の x 全体で計算)
+    return build_fit_results(x, popt, peak_infos, verbose)
+
+
+def build_fit_results(x, popt, peak_infos, verbose=False):
+    """
+    収束したパラメータ popt ([amp, center, fwhm, mix] x ピーク数) から
+    perform_fitting と同じ (fitted_peaks, y_sum_fit) を作る (peak_infos は各ピークの設定, "name" を使う)
+    """
     try:
         fitted_peaks = []
         num_peaks = len(peak_infos)
         
-        # 全体のフィットカーブを計算
-        y_sum_fit = multi_peak_model(x, *popt)
+        # 全体のフィットカーブを計算 (各ピークの波形も一括で求める)
+        y_comps = peak_components(x, popt)
+        y_sum_fit = y_comps.sum(axis=0)
         
         for i in range(num_peaks):
             amp, cen, fwhm, mix = popt[i*4 : (i+1)*4]
             
             # このピーク単体の波形
-            y_comp = pseudo_voigt(x, amp, cen, fwhm, mix)
+            y_comp = y_comps[i]
             
             # 面積計算 (台形積分)
             area = np.trapz(y_comp, x) 
@@ -152,4 +355,371 @@ def perform_fitting(x, y, config, verbose=False):
 
     except Exception as e:
         if verbose: print(f"Result Processing Error: {e}")
-        return None, None
\ No newline at end of file
+        return None, None
+
+def _limited(model, jac, timeout, should_stop):
+    """関数評価のたびに経過時間と中止の要求を確認する model / jac を返す (超えたら FitAborted)"""
+    deadline = time.perf_counter() + timeout if timeout is not None else None
+
+    def check():
+        if should_stop is not None and should_stop():
+            raise FitAborted("cancelled")
+        if deadline is not None and time.perf_counter() > deadline:
+            raise FitAborted("timeout")
+
+    def limited_model(x, *params):
+        check()
+        return model(x, *params)
+
+    def limited_jac(x, *params):
+        check()
+        return jac(x, *params)
+
+    return limited_model, limited_jac if jac is not None else None
+
+def _warm_start_params(initial_params, num_peaks):
+    """initial_params を [amp, center, fwhm, mix] x ピーク数 の配列に変換する (使えない場合は None)"""
+    if initial_params is None:
+        return None
+    try:
+        if len(initial_params) > 0 and isinstance(initial_params[0], dict):
+            values = [[p["amplitude"], p["center"], p["fwhm"], p["mix_ratio"]] for p in initial_params]
+        else:
+            values = initial_params
+        values = np.asarray(values, dtype=float).ravel()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if values.size != 4 * num_peaks or not np.all(np.isfinite(values)):
+        return None
+    return values
+
+
+class WarmStartCache:
+    """
+    過去のフィッティング結果 (収束したパラメータ) を タグ/試料名 ごとに保持するクラス
+    同じ試料の結果が無い場合は、同じタグで最後に成功した結果を返す
+    """
+
+    def __init__(self):
+        self._params = {}      # (sample, tag) -> パラメータ配列
+        self._last_by_tag = {}  # tag -> パラメータ配列
+
+    def get(self, tag, sample=None):
+        params = self._params.get((sample, tag))
+        if params is None:
+            params = self._last_by_tag.get(tag)
+        return params
+
+    def put(self, tag, fitted_peaks, sample=None):
+        if not fitted_peaks:
+            return
+        params = _warm_start_params(fitted_peaks, len(fitted_peaks))
+        if params is not None:
+            self._params[(sample, tag)] = params
+            self._last_by_tag[tag] = params
+
+    def clear(self):
+        self._params.clear()
+        self._last_by_tag.clear()
+
+
+def fit_series(x_list, y_list, config, warm_start=True, cache=None, tag=None, samples=None, verbose=False,
+               auto_guess=False, rois=None, reduce_points=False):
+    """
+    深さ方向分析・時系列など、同じ領域の一連のスペクトルを順番にフィッティングする
+    warm_start: True の場合は直前のスペクトルの収束値を次の初期値にする
+    cache: WarmStartCache を渡すと、先頭の初期値を過去の結果 (tag, samples[i]) から取り、結果も保存する
+    auto_guess: 引き継ぐ初期値が無いスペクトルでは強度の初期値を estimate_amplitudes で推定する
+    rois, reduce_points: perform_fitting_parallel と同じ (スペクトルごとの ROI / 点の間引き)
+    戻り値: (results, nfev_list)  results は perform_fitting の戻り値のリスト、nfev_list は評価回数 (失敗はNone)
+    """
+    results = []
+    nfev_list = []
+    previous = None
+
+    for i in range(len(y_list)):
+        sample = samples[i] if samples is not None else None
+
+        seed = previous if warm_start else None
+        if seed is None and cache is not None:
+            seed = cache.get(tag, sample)
+
+        info = {}
+        peaks, y_sum = perform_fitting(x_list[i], y_list[i], config, verbose, initial_params=seed, info=info,
+                                       auto_guess=auto_guess, roi=rois[i] if rois is not None else None,
+                                       reduce_points=reduce_points)
+        results.append((peaks, y_sum))
+        nfev_list.append(info.get("nfev") if peaks is not None else None)
+
+        if peaks is not None:
+            previous = info["popt"]
+            if cache is not None:
+                cache.put(tag, peaks, sample)
+
+    return results, nfev_list
+
+
+# 一括フィッティングで全スペクトル共通にする項目の既定値 (強度はスペクトルごと)
+SERIES_SHARED = ("center", "fwhm", "mix")
+_PARAM_NAMES = ("amplitude", "center", "fwhm", "mix")
+
+def fit_series_global(x_list, y_list, config, shared=SERIES_SHARED, verbose=False, info=None,
+                      max_nfev=None, initial_params=None):
+    """
+    一連のスペクトル (深さ方向分析のサイクルなど) を1つの最小二乗問題として同時にフィッティングする
+    shared の項目 ("center", "fwhm", "mix") は全スペクトル共通の1つの値、強度と shared 以外の項目はスペクトルごと
+    ヤコビアンは「共通の列 + そのスペクトルの列」だけを持つブロック疎行列 (scipy.optimize.least_squares + lsmr)
+    (mix をスペクトルごとにすると強度との相関で収束が遅くなるので、通常は既定のまま共通にする)
+    計算時間は「全体の反復回数 (info["nfev"]) x 全スペクトルの点数」に比例し、反復回数はデータ次第なので
+    fit_series (warm_start) より常に速いわけではない (1CPU, 3ピークでの実測):
+      ~100本 x 400点 で反復 6~8 回なら 0.2~0.35秒 (fit_series は 0.6~0.8秒)
+      途中で消えるピークなどで反復が 14 回以上かかると同じ大きさでも 0.6~0.8秒 になり、fit_series より遅いこともある
+      100本 x 1500点 では 0.5~0.85秒 (fit_series は 0.9~1.0秒) で差はほとんど無い
+    速度のためではなく、位置・FWHM をスペクトル間で共通にしたいときに使う (結果は fit_series と同じにはならない)
+    initial_params: 共通の項目の初期値 ([amp, center, fwhm, mix] x ピーク数、強度は使わない)
+                    省略時は全スペクトルの平均 (x が同じ場合。異なる場合は先頭) を perform_fitting した結果
+    info: 辞書を渡すと "nfev", "njev", "cost", "success", "shared" ({項目: ピークごとの値}) を書き込む
+    戻り値: スペクトルごとの (fitted_peaks, y_sum_fit) のリスト (fit_series の results と同じ形式。失敗は (None, None))
+    """
+    from scipy.optimize import least_squares
+    from scipy.sparse import csr_matrix
+
+    n_spec = len(y_list)
+    failed = [(None, None)] * n_spec
+    shared = tuple(shared)
+    if "amplitude" in shared or any(t not in _PARAM_NAMES for t in shared):
+        raise ValueError(f"共通にできる項目は center, fwhm, mix です: {shared}")
+    if n_spec == 0 or len(config) == 0:
+        return failed
+
+    xs = [np.asarray(x, dtype=float) for x in x_list]
+    ys = [np.asarray(y, dtype=float) for y in y_list]
+    if any(len(x) < 5 or len(x) != len(y) for x, y in zip(xs, ys)):
+        return failed
+    n_peaks = len(config)
+    n_par = 4 * n_peaks
+
+    # 1. パラメータの並び: [共通 (ピーク x 共通の項目)] + [スペクトルごと (ピーク x 残りの項目)] x スペクトル数
+    #    colmap[s] はスペクトル s の [amp, center, fwhm, mix] x ピーク数 が全体のどの位置かを表す
+    is_shared = np.array([t in shared for t in _PARAM_NAMES])
+    n_sh, n_loc = int(is_shared.sum()), int((~is_shared).sum())
+    sh_pos = np.cumsum(is_shared) - 1
+    loc_pos = np.cumsum(~is_shared) - 1
+    n_theta = n_peaks * n_sh + n_spec * n_peaks * n_loc
+
+    colmap = np.empty((n_spec, n_par), dtype=np.int64)
+    for k in range(n_peaks):
+        for t in range(4):
+            if is_shared[t]:
+                colmap[:, k * 4 + t] = k * n_sh + sh_pos[t]
+            else:
+                colmap[:, k * 4 + t] = (n_peaks * n_sh + np.arange(n_spec) * n_peaks * n_loc
+                                        + k * n_loc + loc_pos[t])
+
+    # 2. 境界 (perform_fitting と同じ: 位置・FWHM は peak_limits, 強度 0以上, 混合比 0~1)
+    try:
+        limits = np.array([peak_limits(p) for p in config], dtype=float).reshape(-1, 6)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        if verbose: print(f"Config Error: {e}")
+        return failed
+    lo = np.column_stack([np.zeros(n_peaks), limits[:, 1], limits[:, 4], np.zeros(n_peaks)]).ravel()
+    hi = np.column_stack([np.full(n_peaks, np.inf), limits[:, 2], limits[:, 5], np.ones(n_peaks)]).ravel()
+    theta_lo = np.empty(n_theta)
+    theta_hi = np.empty(n_theta)
+    theta_lo[colmap] = lo
+    theta_hi[colmap] = hi
+
+    # 3. 初期値: 共通の項目は代表スペクトルのフィット結果、強度はスペクトルごとにNNLS
+    base = _warm_start_params(initial_params, n_peaks)
+    same_x = all(len(x) == len(xs[0]) and np.array_equal(x, xs[0]) for x in xs)
+    if base is None:
+        y_ref = np.mean(ys, axis=0) if same_x else ys[0]
+        fit_info = {}
+        perform_fitting(xs[0], y_ref, config, verbose, info=fit_info)
+        base = fit_info.get("popt")
+        if base is None:
+            base = np.column_stack([np.full(n_peaks, np.max(y_ref) * 0.5), limits[:, 0], limits[:, 3],
+                                    np.full(n_peaks, 0.3)]).ravel()
+    base = np.clip(np.asarray(base, dtype=float), lo, hi).reshape(n_peaks, 4)
+
+    theta0 = np.empty(n_theta)
+    for s in range(n_spec):
+        start = base.copy()
+        # 推定に失敗したスペクトルは代表スペクトルの強度のまま
+        start[:, 0] = _guess_amplitudes(xs[s], ys[s], base[:, 1], base[:, 2], float(np.mean(base[:, 3])), base[:, 0],
+                                        verbose)
+        theta0[colmap[s]] = start.ravel()
+    theta0 = np.clip(theta0, theta_lo, theta_hi)
+
+    # 4. 残差と疎ヤコビアン (各行の非ゼロは そのスペクトルの 4 x ピーク数 列だけ)
+    lengths = np.array([len(x) for x in xs], dtype=np.int64)
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    indices = np.concatenate([np.tile(colmap[s], lengths[s]) for s in range(n_spec)])
+    indptr = np.arange(int(bounds[-1]) + 1, dtype=np.int64) * n_par
+    shape = (int(bounds[-1]), n_theta)
+
+    if same_x:
+        # 共通のエネルギー軸 (XPSSTACK のスタックなど): 全スペクトルを (スペクトル数 x ピーク数 x 点数) で一括計算
+        x_common = xs[0]
+        y_all = np.concatenate(ys)
+
+        def residuals(theta):
+            p = theta[colmap].reshape(n_spec, n_peaks, 4)
+            comps = pseudo_voigt(x_common, p[..., 0:1], p[..., 1:2], p[..., 2:3], p[..., 3:4])
+            return comps.sum(axis=1).ravel() - y_all
+
+        def jacobian(theta):
+            p = theta[colmap].reshape(n_spec, n_peaks, 4)
+            blocks = np.empty((n_spec, len(x_common), n_par))
+            for k, deriv in enumerate(peak_derivatives(x_common, p)):
+                blocks[:, :, k::4] = deriv.transpose(0, 2, 1)
+            return csr_matrix((blocks.ravel(), indices, indptr), shape=shape)
+    else:
+        def residuals(theta):
+            params = theta[colmap]
+            return np.concatenate([multi_peak_model(xs[s], *params[s]) - ys[s] for s in range(n_spec)])
+
+        def jacobian(theta):
+            params = theta[colmap]
+            data = np.concatenate([multi_peak_jacobian(xs[s], *params[s]).ravel() for s in range(n_spec)])
+            return csr_matrix((data, indices, indptr), shape=shape)
+
+    start_time = time.perf_counter() if XPSPROF.enabled else None
+    try:
+        res = least_squares(residuals, theta0, jac=jacobian, bounds=(theta_lo, theta_hi), method="trf",
+                            tr_solver="lsmr", max_nfev=max_nfev)
+    except Exception as e:
+        if verbose: print(f"Global Fitting Failed: {e}")
+        if start_time is not None:
+            XPSPROF.record("fit_global", time.perf_counter() - start_time, spectra=n_spec, points=shape[0],
+                           peaks=n_peaks, success=False, error=type(e).__name__)
+        return failed
+
+    if start_time is not None:
+        XPSPROF.record("fit_global", time.perf_counter() - start_time, spectra=n_spec, points=shape[0],
+                       peaks=n_peaks, nfev=int(res.nfev), success=bool(res.success))
+    if info is not None:
+        info["nfev"] = int(res.nfev)
+        info["njev"] = int(res.njev) if res.njev is not None else None
+        info["cost"] = float(res.cost)
+        info["success"] = bool(res.success)
+        shared_values = res.x[colmap[0]].reshape(n_peaks, 4)
+        info["shared"] = {t: shared_values[:, _PARAM_NAMES.index(t)].tolist() for t in shared}
+    if not res.success:
+        if verbose: print(f"Global Fitting Failed: {res.message}")
+        return failed
+
+    # 5. スペクトルごとに perform_fitting と同じ形式の結果を作る
+    params = res.x[colmap]
+    return [build_fit_results(xs[s], params[s], config, verbose) for s in range(n_spec)]
+
+
+# --- 4. 複数領域の並列フィッティング ---
+def perform_fitting_parallel(x_list, y_list, configs, workers=None, executor=None, verbose=False, auto_guess=False,
+                             rois=None, roi_margin=ROI_MARGIN, reduce_points=False):
+    """
+    複数の領域 (C1s, O1s, ...) のフィッティングをプロセスプールで同時に行う
+    x, y は共有メモリにまとめて置き、各ワーカーはpickleを介さずに直接読み出す
+    configs: 領域ごとのピーク設定 (None または空の領域はフィッティングしない)
+    executor: 既存の ProcessPoolExecutor (省略時は get_executor(workers) の共有プールを使い回す)
+    auto_guess, roi_margin, reduce_points: perform_fitting と同じ
+    rois: 領域ごとの (x_min, x_max) (省略時・None の領域は全点でフィットする)
+    戻り値: 領域の順に (fitted_peaks, y_sum_fit) のリスト (対象外・失敗は (None, None))
+    """
+    from multiprocessing import shared_memory
+
+    n = len(x_list)
+    results = [(None, None)] * n
+    targets = [i for i in range(n) if configs[i]]
+    if len(targets) == 0:
+        return results
+
+    # 1. 全領域の x, y を (2 x 全点数) の共有メモリにまとめる
+    lengths = [len(x_list[i]) for i in range(n)]
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(int)
+    total = int(offsets[-1])
+
+    shm = shared_memory.SharedMemory(create=True, size=max(2 * total * 8, 8))
+    data = None
+    try:
+        data = np.ndarray((2, total), dtype=np.float64, buffer=shm.buf)
+        for i in range(n):
+            data[0, offsets[i]:offsets[i + 1]] = x_list[i]
+            data[1, offsets[i]:offsets[i + 1]] = y_list[i]
+
+        # 2. 領域ごとにタスクを投入し、元の順番で結果を受け取る
+        pool = executor or get_executor(workers)
+        futures = {
+            i: pool.submit(_fit_shared_region, shm.name, total, offsets[i], offsets[i + 1], configs[i], verbose,
+                           auto_guess, rois[i] if rois is not None else None, roi_margin, reduce_points)
+            for i in targets
+        }
+        for i, future in futures.items():
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                if verbose: print(f"Parallel Fitting Failed: {e}")
+    finally:
+        data = None  # 共有メモリを閉じる前にビューを解放する
+        shm.close()
+        shm.unlink()
+
+    return results
+
+
+# 並列フィッティング用の共有プロセスプール (get_executor で作成し、呼び出し・セッションをまたいで使い回す)
+_executor = None
+_executor_workers = None
+_executor_lock = threading.Lock()
+_atexit_registered = False
+
+
+def get_executor(workers=None):
+    """
+    並列フィッティング用のプロセスプールを返す
+    workers が前回と同じで、プールが使える状態なら既存のものを返す (ワーカーの起動は最初の1回だけ)
+    不要になったら shutdown_executor で止める (プロセス終了時にも止める)
+    """
+    global _executor, _executor_workers, _atexit_registered
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _executor_lock:
+        if _executor is not None and (_executor_workers != workers or getattr(_executor, "_broken", False)):
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            _executor_workers = workers
+            if not _atexit_registered:
+                atexit.register(shutdown_executor)
+                _atexit_registered = True
+        return _executor
+
+
+def shutdown_executor(wait=True):
+    """get_executor の共有プロセスプールを止める (次の get_executor で作り直す)"""
+    global _executor, _executor_workers
+    with _executor_lock:
+        executor, _executor, _executor_workers = _executor, None, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _fit_shared_region(shm_name, total, start, end, config, verbose, auto_guess=False, roi=None,
+                       roi_margin=ROI_MARGIN, reduce_points=False):
+    """ワーカー側: 共有メモリ上の1領域をフィッティングする (必要な範囲をコピーしたら共有メモリは閉じる)"""
+    from multiprocessing import shared_memory
+
+    # プール内のワーカーは作成側と同じresource_trackerを使うので、削除 (unlink) は作成側に任せてよい
+    shm = shared_memory.SharedMemory(name=shm_name)
+    data = None
+    try:
+        data = np.ndarray((2, total), dtype=np.float64, buffer=shm.buf)
+        x = data[0, start:end].copy()
+        y = data[1, start:end].copy()
+    finally:
+        data = None  # 閉じる前にビューを解放する
+        shm.close()
+    return perform_fitting(x, y, config, verbose, auto_guess=auto_guess, roi=roi, roi_margin=roi_margin,
+                           reduce_points=reduce_points)
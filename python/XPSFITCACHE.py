@@ -0,0 +1,195 @@
+#フィッティング結果キャッシュ (正味スペクトル・ピーク設定・オプションが同じならフィットをやり直さない)
+import hashlib
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+
+import XPSCACHE
+import XPSFIT
+
+DEFAULT_FIT_MAX_BYTES = 64 * 1024 * 1024  # 64 MB (1エントリは数百バイトのJSON)
+MEMORY_MAX_ENTRIES = 4096  # プロセス内に保持するエントリ数の上限 (古く使われていないものから捨てる)
+# 容量の確認 (フォルダ内の全ファイルを調べる) は保存のたびではなく、この回数ごとに行う
+# (上限を超える分は最大でこの件数のエントリ = 数十KB程度)
+EVICT_INTERVAL = 64
+
+# ヒット/ミスの集計 (get_fit_cache_stats で参照)
+fit_cache_stats = {"hits": 0, "misses": 0, "stores": 0, "invalidated": 0}
+
+# プロセス内のキャッシュ (キー -> エントリ, 最近使った順)。ディスクより先に参照する
+_memory = OrderedDict()
+
+# 前回の容量確認からの保存数 (プロセスで最初の保存でも確認するように上限から始める)
+_stores_since_evict = EVICT_INTERVAL
+
+
+def fit_cache_key(x, y, config, use_jac=True, initial_params=None, auto_guess=False, roi=None,
+                  roi_margin=XPSFIT.ROI_MARGIN, reduce_points=False):
+    """x, 正味強度 y, その領域のピーク設定, フィットのオプションから決まるキー (sha1) を返す"""
+    h = hashlib.sha1()
+    for arr in (x, y):
+        arr = np.ascontiguousarray(arr, dtype=np.float64)
+        h.update(str(arr.shape).encode("ascii"))
+        h.update(arr.tobytes())
+    h.update(json.dumps(config, sort_keys=True, ensure_ascii=False, default=float).encode("utf-8"))
+
+    warm = XPSFIT._warm_start_params(initial_params, len(config))
+    options = {"use_jac": bool(use_jac), "initial_params": None if warm is None else warm.tolist()}
+    # 既定値のオプションはキーに含めない (追加前に保存したエントリもそのまま使える)
+    if auto_guess:
+        options["auto_guess"] = True
+    if roi is not None:
+        options["roi"] = [float(roi[0]), float(roi[1]), float(roi_margin)]
+    if reduce_points:
+        options["reduce_points"] = True
+    h.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def perform_fitting_cached(x, y, config, verbose=False, use_jac=True, initial_params=None, info=None,
+                           cache_dir=None, max_bytes=DEFAULT_FIT_MAX_BYTES, auto_guess=False, roi=None,
+                           roi_margin=XPSFIT.ROI_MARGIN, reduce_points=False, **limits):
+    """
+    XPSFIT.perform_fitting のキャッシュ付き版 (引数・戻り値は同じ)
+    同じ入力のフィットは保存済みのパラメータから結果を組み立てるだけで返す
+    info には perform_fitting と同じ項目に加えて "cached" (True/False) が入る
+    limits: max_nfev, timeout, should_stop (perform_fitting にそのまま渡す。結果は変わらないのでキーには含めない)
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    key = fit_cache_key(x, y, config, use_jac, initial_params, auto_guess, roi, roi_margin, reduce_points)
+
+    result = lookup(key, x, cache_dir, info)
+    if result is not None:
+        return result
+
+    fit_info = {} if info is None else info
+    fitted_peaks, y_sum_fit = XPSFIT.perform_fitting(x, y, config, verbose, use_jac=use_jac,
+                                                     initial_params=initial_params, info=fit_info,
+                                                     auto_guess=auto_guess, roi=roi, roi_margin=roi_margin,
+                                                     reduce_points=reduce_points, **limits)
+    fit_info["cached"] = False
+    if fitted_peaks is not None:
+        store(key, config, fitted_peaks, fit_info.get("nfev"), cache_dir, max_bytes)
+    return fitted_peaks, y_sum_fit
+
+
+def lookup(key, x, cache_dir=None, info=None):
+    """キーに対応する保存済みの結果を (fitted_peaks, y_sum_fit) で返す (無い場合は None)"""
+    entry = _memory.get(key)
+    if entry is not None:
+        _memory.move_to_end(key)
+        # ディスク側の最終使用時刻もそろえる (よく使うエントリがLRUで先に消されないように)
+        try:
+            os.utime(os.path.join(_fit_dir(cache_dir), key + ".json"))
+        except OSError:
+            pass
+    else:
+        meta_path = os.path.join(_fit_dir(cache_dir), key + ".json")
+        entry = XPSCACHE._read_meta(meta_path)
+        if entry is not None:
+            os.utime(meta_path)  # LRU用に最終使用時刻を更新
+            _remember(key, entry)
+
+    if entry is None:
+        fit_cache_stats["misses"] += 1
+        return None
+
+    popt = np.asarray(entry["popt"], dtype=float)
+    result = XPSFIT.build_fit_results(np.asarray(x, dtype=float), popt, [{"name": n} for n in entry["names"]])
+    if result[0] is None:
+        fit_cache_stats["misses"] += 1
+        return None
+
+    fit_cache_stats["hits"] += 1
+    if info is not None:
+        info["nfev"] = 0
+        info["popt"] = popt
+        info["warm_start"] = False
+        info["cached"] = True
+    return result
+
+
+def store(key, config, fitted_peaks, nfev=None, cache_dir=None, max_bytes=DEFAULT_FIT_MAX_BYTES):
+    """
+    フィット結果のパラメータ (amp, center, fwhm, mix) を保存する
+    容量の上限は EVICT_INTERVAL 回ごとに確認する (すぐに確認する場合は evict)
+    """
+    global _stores_since_evict
+    levels = sorted({str(p.get("level", "")) for p in config})
+    entry = {
+        "levels": levels,
+        "names": [p["name"] for p in fitted_peaks],
+        "popt": [float(v) for p in fitted_peaks for v in (p["amplitude"], p["center"], p["fwhm"], p["mix_ratio"])],
+        "nfev": nfev,
+    }
+    _remember(key, entry)
+    fit_cache_stats["stores"] += 1
+
+    folder = _fit_dir(cache_dir)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        XPSCACHE._write_meta(os.path.join(folder, key + ".json"), entry)
+        _stores_since_evict += 1
+        if _stores_since_evict >= EVICT_INTERVAL:
+            evict(cache_dir, max_bytes)
+    except OSError as e:
+        print(f"フィット結果キャッシュの保存に失敗しました: {e}")
+
+
+def evict(cache_dir=None, max_bytes=DEFAULT_FIT_MAX_BYTES):
+    """fits の上限とキャッシュフォルダ全体の上限を超えた分を古いものから削除する (一括処理の最後などに呼ぶ)"""
+    global _stores_since_evict
+    _stores_since_evict = 0
+    removed = XPSCACHE.evict_lru(_fit_dir(cache_dir), max_bytes)  # fits の中の上限
+    removed += XPSCACHE.evict_cache(cache_dir)                     # キャッシュフォルダ全体の上限
+    return removed
+
+
+def invalidate(key=None, level=None, cache_dir=None):
+    """
+    保存済みのフィット結果を削除する
+    key: そのエントリだけ / level: そのタグ (例 "C1s") のピーク設定を含むエントリ / どちらも None: すべて
+    戻り値: 削除したエントリ数
+    """
+    folder = _fit_dir(cache_dir)
+    keys = set(_memory)
+    if os.path.isdir(folder):
+        keys.update(name[:-5] for name in os.listdir(folder) if name.endswith(".json"))
+
+    removed = 0
+    for k in keys:
+        if key is not None and k != key:
+            continue
+        if level is not None:
+            entry = _memory.get(k) or XPSCACHE._read_meta(os.path.join(folder, k + ".json"))
+            if entry is None or level not in entry.get("levels", []):
+                continue
+
+        _memory.pop(k, None)
+        try:
+            os.remove(os.path.join(folder, k + ".json"))
+        except OSError:
+            pass
+        removed += 1
+
+    fit_cache_stats["invalidated"] += removed
+    return removed
+
+
+def get_fit_cache_stats():
+    """ヒット/ミス/保存/削除数のコピーを返す"""
+    return dict(fit_cache_stats)
+
+
+def _remember(key, entry):
+    """プロセス内のキャッシュに追加する (MEMORY_MAX_ENTRIES を超えた分は最も古いものから捨てる)"""
+    _memory[key] = entry
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_MAX_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def _fit_dir(cache_dir):
+    return os.path.join(XPSCACHE._resolve_cache_dir(cache_dir), "fits")
@@ -0,0 +1,302 @@
+#ジョブ実行 (解析を段階ごとのタスクに分けてバックグラウンドで実行し、進捗の通知・途中での中止を行う)
+#
+# 使い方:
+#   scheduler = XPSJOBS.JobScheduler(callback=print)
+#   job = scheduler.submit(XPSJOBS.AnalysisJob(path, rsf_list, peak_db, fit_timeout=5.0))
+#   for event in job.poll(timeout=0.1): ...   # 進捗 (UIのタイマーなどから定期的に呼ぶ)
+#   job.abort_fit()                           # 実行中のフィッティングだけを打ち切って次へ進む
+#   job.cancel()                              # ジョブ全体を中止する
+# 結果は job.results にタスクが終わるたびに追加される (途中経過をそのまま表示できる)
+import itertools
+import queue
+import threading
+import time
+
+import XPSASC
+import XPSCAL
+from XPSCONFIG import index_peaks
+from XPSSESSION import AnalysisSession
+from XPSSPEC import as_lists
+
+# ジョブ・タスクの状態
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"    # フィッティングの時間切れ
+ABORTED = "aborted"    # abort_fit で打ち切ったフィッティング
+
+_job_ids = itertools.count(1)
+
+
+class JobCancelled(Exception):
+    """ジョブの中止が要求された (タスクの開始前に確認する)"""
+
+
+class AnalysisJob:
+    """
+    1ファイル分の 読み込み → 帯電補正 → 定量 → フィッティング (領域ごと) → Excel出力 をタスクとして順に実行するジョブ
+    source: ASCファイルのパス、XPSSPEC.SpectrumSet、または (tags, x_list, y_list)
+    shift_setting: {"XMin", "XMax", "ShiftPeakCenter"} (None なら帯電補正しない)
+    output_path: Excelの保存先 (None なら出力しない)
+    fit_timeout: 1領域のフィッティングの経過時間の上限 (秒) / fit_max_nfev: 関数評価回数の上限
+    callback: イベントごとに呼ぶ関数 (実行中のスレッドから呼ばれる)
+    session_options: AnalysisSession に渡す引数 (fit_cache, auto_guess など)
+    """
+
+    def __init__(self, source, rsf_list, peak_db, shift_setting=None, output_path=None,
+                 fit_timeout=None, fit_max_nfev=None, callback=None, session_options=None):
+        self.id = next(_job_ids)
+        self.source = source
+        self.rsf_list = rsf_list
+        self.peak_db = peak_db
+        self.shift_setting = shift_setting
+        self.output_path = output_path
+        self.fit_timeout = fit_timeout
+        self.fit_max_nfev = fit_max_nfev
+        self.callback = callback
+        self.session_options = dict(session_options or {})
+
+        self.status = PENDING
+        self.error = None
+        self.session = None
+        # 途中経過を含む結果 (fits は領域ごと。未実行・対象外・失敗は None)
+        # fit_status: {領域番号: 状態}、fit_errors: {領域番号: 失敗・打ち切りの内容}
+        self.results = {"tags": [], "atomic_percent": None, "fits": [], "fit_status": {}, "fit_errors": {},
+                        "excel": None}
+
+        self._events = queue.Queue()
+        self._cancel = threading.Event()
+        self._abort_fit = threading.Event()
+        self._done = threading.Event()
+
+    # --- 呼び出し側 (別スレッド) からの操作 ---
+    def cancel(self):
+        """ジョブを中止する (実行中のフィッティングも打ち切る)"""
+        self._cancel.set()
+
+    def abort_fit(self):
+        """実行中のフィッティングだけを打ち切り、次の領域へ進む"""
+        self._abort_fit.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """ジョブの終了を待つ (終了していれば True)"""
+        return self._done.wait(timeout)
+
+    def poll(self, timeout=0.0):
+        """
+        届いているイベントをすべて返す
+        timeout: 1件も無い場合に待つ時間 (秒)。0 ならすぐに返す
+        """
+        events = []
+        try:
+            events.append(self._events.get(timeout=timeout) if timeout else self._events.get_nowait())
+            while True:
+                events.append(self._events.get_nowait())
+        except queue.Empty:
+            pass
+        return events
+
+    # --- 実行 ---
+    def run(self):
+        """ジョブを呼び出したスレッドで実行する (JobScheduler からも呼ばれる)。戻り値は results"""
+        start = time.perf_counter()
+        self.status = RUNNING
+        self._emit("job", RUNNING)
+        try:
+            self._task("load", self._load)
+            if self.shift_setting is not None:
+                self._task("shift", self._shift)
+            self._task("quantify", self._quantify)
+
+            targets = self._fit_targets()
+            for n, (i, config) in enumerate(targets):
+                self._abort_fit.clear()  # 前の領域への打ち切り要求は持ち越さない
+                self._task("fit", self._fit, i, config, index=i, tag=self.results["tags"][i],
+                           done=n, total=len(targets))
+
+            if self.output_path is not None:
+                self._task("export", self._export)
+            self.status = DONE
+        except JobCancelled:
+            self.status = CANCELLED
+        except Exception as e:
+            self.status = FAILED
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            self._emit("job", self.status, elapsed=time.perf_counter() - start, message=self.error)
+            self._done.set()
+        return self.results
+
+    def _task(self, stage, func, *args, **event):
+        """タスク1つを実行し、開始・終了のイベントを送る (中止が要求されていれば JobCancelled)"""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self._emit(stage, RUNNING, **event)
+        start = time.perf_counter()
+        try:
+            status = func(*args) or DONE
+        except JobCancelled:
+            raise
+        except Exception as e:
+            self._emit(stage, FAILED, elapsed=time.perf_counter() - start, message=f"{type(e).__name__}: {e}", **event)
+            raise
+        if "done" in event:
+            event["done"] += 1
+        self._emit(stage, status, elapsed=time.perf_counter() - start, **event)
+        if status == CANCELLED:
+            raise JobCancelled()
+
+    def _load(self):
+        if isinstance(self.source, str):
+            tags, x_list, y_list = XPSASC.load_allspe(self.source)
+            if len(tags) == 0:
+                raise ValueError(f"データを読み込めませんでした: {self.source}")
+        elif isinstance(self.source, tuple):
+            tags, x_list, y_list = self.source
+        else:
+            tags, x_list, y_list = as_lists(self.source)
+        self.session = AnalysisSession(tags, x_list, y_list, **self.session_options)
+        self.results["tags"] = list(self.session.tags)
+        self.results["fits"] = [None] * len(self.session.tags)
+
+    def _shift(self):
+        # 帯電補正 (C1sが無い場合などは補正なしで続行)
+        session = self.session
+        shifted = XPSCAL.shift(
+            session.tags, session.x_list, session.y_list,
+            self.shift_setting.get("XMin", 280.0), self.shift_setting.get("XMax", 290.0),
+            self.shift_setting.get("ShiftPeakCenter", 284.4)
+        )
+        if isinstance(shifted, tuple):
+            self.session = AnalysisSession(session.tags, shifted[0], shifted[1], **self.session_options)
+
+    def _quantify(self):
+        self.results["atomic_percent"] = self.session.atomic_percent(self.rsf_list)
+
+    def _fit_targets(self):
+        """フィッティングする (領域番号, ピーク設定) のリスト (run_analysis と同じく先頭とCuLMMは対象外)"""
+        peaks = index_peaks(self.peak_db) if self.peak_db else {}
+        targets = []
+        for i, tag in enumerate(self.session.tags):
+            config = peaks.get(tag) if i != 0 and tag != "CuLMM" else None
+            if config:
+                targets.append((i, config))
+        return targets
+
+    def _fit(self, index, config):
+        limits = {"should_stop": self._should_stop, "timeout": self.fit_timeout}
+        if self.fit_max_nfev is not None:
+            limits["max_nfev"] = self.fit_max_nfev
+
+        info = {}
+        fitted_peaks, y_total = self.session.fit(index, config, info=info, **limits)
+        if fitted_peaks is None:
+            if self._cancel.is_set():
+                status = CANCELLED
+            elif info.get("aborted") is not None:
+                status = TIMEOUT if info["aborted"] == "timeout" else ABORTED
+            else:
+                status = FAILED
+            # 打ち切り・失敗した領域は結果なしのまま次へ進む (ジョブ全体の中止のみ CANCELLED でジョブを止める)
+            self.results["fit_status"][index] = status
+            if info.get("error") is not None:
+                self.results["fit_errors"][index] = info["error"]
+            return status
+
+        self.results["fits"][index] = {"y_bg": self.session.background(index)["y_bg"], "y_total": y_total,
+                                       "peaks": fitted_peaks}
+        self.results["fit_status"][index] = DONE
+        return DONE
+
+    def _should_stop(self):
+        return self._cancel.is_set() or self._abort_fit.is_set()
+
+    def _export(self):
+        import XPSOUTPUTXL
+        session = self.session
+        XPSOUTPUTXL.export_to_excel(self.output_path, session.tags, session.x_list, session.y_list,
+                                    self.results["fits"], self.results["atomic_percent"])
+        self.results["excel"] = self.output_path
+
+    def _emit(self, stage, status, **fields):
+        """
+        イベント {"job", "stage", "status", ("index", "tag", "done", "total", "elapsed", "message")} を送る
+        stage: "job" (ジョブ全体) / "load" / "shift" / "quantify" / "fit" / "export"
+        """
+        event = {"job": self.id, "stage": stage, "status": status}
+        event.update((k, v) for k, v in fields.items() if v is not None)
+        self._events.put(event)
+        if self.callback is not None:
+            try:
+                self.callback(event)
+            except Exception as e:
+                print(f"進捗の通知に失敗しました: {e}")
+
+
+class JobScheduler:
+    """
+    ジョブを1本のバックグラウンドスレッドで投入順に実行するクラス
+    callback: 全ジョブのイベントごとに呼ぶ関数 (各ジョブの callback の後に呼ばれる)
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.jobs = {}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        """ジョブを追加する (すぐに返る)。戻り値は job"""
+        if self.callback is not None:
+            job.callback = _chain(job.callback, self.callback)
+        with self._lock:
+            self.jobs[job.id] = job
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="XPSJOBS", daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+        return job
+
+    def cancel(self, job_id=None):
+        """job_id のジョブ (省略時は全ジョブ) を中止する。待機中のジョブは実行せずに終了する"""
+        for job in list(self.jobs.values()):
+            if job_id is None or job.id == job_id:
+                job.cancel()
+
+    def shutdown(self, cancel=True, wait=True):
+        """スレッドを止める (cancel=True の場合は実行中・待機中のジョブも中止する)"""
+        if cancel:
+            self.cancel()
+        self._queue.put(None)
+        thread = self._thread
+        if wait and thread is not None:
+            thread.join()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            job.run()  # 中止済みのジョブは最初のタスクの前に CANCELLED で終わる
+
+
+def _chain(first, second):
+    """2つのコールバックを順に呼ぶ関数を返す"""
+    if first is None:
+        return second
+
+    def callback(event):
+        first(event)
+        second(event)
+    return callback
@@ -0,0 +1,162 @@
+#列指向(Parquet)出力 (Excelと同じ内容を解析用データセットとして保存)
+import hashlib
+import os
+import re
+import numpy as np
+
+from XPSSPEC import as_lists
+
+# データセット内のテーブル (フォルダ) 名
+TABLES = ("spectra", "components", "summary")
+
+
+def export_to_parquet(dataset_dir, sample, tags, x_list=None, y_list=None, fit_results_list=None,
+                      atomic_percent=None, include_components=True):
+    """
+    解析結果を Parquet 形式のデータセットに追加する関数 (export_to_excel と同じ引数 + 試料名)
+    dataset_dir/spectra/<sample>.parquet    : 生データ・バックグラウンド・全体フィット (1点1行)
+    dataset_dir/components/<sample>.parquet : 各成分の波形 (バックグラウンドを含まない値, 1点1行)
+    dataset_dir/summary/<sample>.parquet    : Atomic %, Position, FWHM, Area, Ratio (1成分1行)
+    同じ試料名で再出力した場合はその試料のファイルだけが置き換わる (今回行が無いテーブルの古いファイルは削除する)
+    tags に XPSSPEC.SpectrumSet を渡す場合は fit_results_list, atomic_percent をキーワードで指定する
+    fit_results_list / atomic_percent が None の場合はフィット無し / Atomic % 無し (NaN) として出力する
+    戻り値: 書き込んだファイルのパスの辞書 (テーブル名 -> パス)
+    """
+    tags, x_list, y_list = as_lists(tags, x_list, y_list)
+    pa, pq = _import_pyarrow()
+
+    spectra = {k: [] for k in ("tag", "region", "point", "binding_energy", "raw_intensity", "background", "total_fit")}
+    components = {k: [] for k in ("tag", "region", "component", "point", "binding_energy", "intensity")}
+    summary = {k: [] for k in ("tag", "region", "component", "atomic_percent", "center", "fwhm", "area", "ratio")}
+
+    for i, tag in enumerate(tags):
+        x = np.asarray(x_list[i], dtype=float)
+        n = len(x)
+        res = fit_results_list[i] if fit_results_list is not None and i < len(fit_results_list) else None
+
+        # --- 1. スペクトル (生データ + バックグラウンド + 全体フィット) ---
+        spectra["tag"].append(np.full(n, tag, dtype=object))
+        spectra["region"].append(np.full(n, i, dtype=np.int32))
+        spectra["point"].append(np.arange(n, dtype=np.int32))
+        spectra["binding_energy"].append(x)
+        spectra["raw_intensity"].append(np.asarray(y_list[i], dtype=float))
+        if res is not None:
+            y_bg = np.asarray(res["y_bg"], dtype=float)
+            spectra["background"].append(y_bg)
+            spectra["total_fit"].append(np.asarray(res["y_total"], dtype=float) + y_bg)
+        else:
+            spectra["background"].append(np.full(n, np.nan))
+            spectra["total_fit"].append(np.full(n, np.nan))
+
+        # --- 2. 成分ごとの波形とまとめ ---
+        ap = float(atomic_percent[i]) if atomic_percent is not None and i < len(atomic_percent) else np.nan
+        if res is None or len(res["peaks"]) == 0:
+            for key, value in (("tag", tag), ("region", i), ("component", None), ("atomic_percent", ap),
+                               ("center", np.nan), ("fwhm", np.nan), ("area", np.nan), ("ratio", np.nan)):
+                summary[key].append(value)
+            continue
+
+        for peak in res["peaks"]:
+            for key, value in (("tag", tag), ("region", i), ("component", peak["name"]), ("atomic_percent", ap),
+                               ("center", peak["center"]), ("fwhm", peak["fwhm"]),
+                               ("area", peak["area"]), ("ratio", peak["ratio"])):
+                summary[key].append(value)
+
+            if include_components:
+                components["tag"].append(np.full(n, tag, dtype=object))
+                components["region"].append(np.full(n, i, dtype=np.int32))
+                components["component"].append(np.full(n, peak["name"], dtype=object))
+                components["point"].append(np.arange(n, dtype=np.int32))
+                components["binding_energy"].append(x)
+                components["intensity"].append(np.asarray(peak["y_data"], dtype=float))
+
+    tables = {
+        "spectra": _to_table(pa, sample, spectra, concat=True),
+        "components": _to_table(pa, sample, components, concat=True),
+        "summary": _to_table(pa, sample, summary, concat=False),
+    }
+
+    written = {}
+    file_name = _safe_name(sample) + ".parquet"
+    for name, table in tables.items():
+        folder = os.path.join(dataset_dir, name)
+        path = os.path.join(folder, file_name)
+        if table is None:
+            # 前回の出力が残っていると読み込み側に古い成分・フィットが見えるため消す
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        os.makedirs(folder, exist_ok=True)
+        # 一時ファイルは "." で始める (pyarrow.dataset は "." / "_" で始まるファイルを読まない)
+        tmp_path = os.path.join(folder, "." + file_name + ".tmp")
+        try:
+            pq.write_table(table, tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        written[name] = path
+
+    return written
+
+
+def read_dataset(dataset_dir, table="summary", columns=None, filter=None):
+    """
+    データセットの1テーブルを全試料分まとめて読み込む (pyarrow.Table を返す)
+    columns: 読み込む列名のリスト (必要な列だけ読むので高速)
+    filter: pyarrow.dataset の条件式 (例: pyarrow.dataset.field("tag") == "C1s")
+    """
+    if table not in TABLES:
+        raise ValueError(f"table は {TABLES} のいずれかを指定してください: {table}")
+    _import_pyarrow()
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(os.path.join(dataset_dir, table), format="parquet")
+    return dataset.to_table(columns=columns, filter=filter)
+
+
+# --- ヘルパー ---
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet出力には pyarrow が必要です (pip install pyarrow)") from e
+    return pa, pq
+
+
+def _to_table(pa, sample, columns, concat):
+    """列の辞書から pyarrow.Table を作る (先頭に sample 列を付ける。行が無ければ None)"""
+    if concat:
+        if len(columns["tag"]) == 0:
+            return None
+        values = {k: np.concatenate(v) for k, v in columns.items()}
+    else:
+        if len(columns["tag"]) == 0:
+            return None
+        values = dict(columns)
+
+    n = len(values["tag"])
+    arrays = {"sample": pa.array([sample] * n, type=pa.string()).dictionary_encode()}
+    for key, value in values.items():
+        if key in ("tag", "component"):
+            arrays[key] = pa.array(list(value), type=pa.string()).dictionary_encode()
+        elif key in ("region", "point"):
+            arrays[key] = pa.array(np.asarray(value, dtype=np.int32))
+        else:
+            arrays[key] = pa.array(np.asarray(value, dtype=np.float64))
+    return pa.table(arrays)
+
+
+def _safe_name(sample):
+    """
+    試料名をファイル名に使える形にする
+    置き換えが必要だった名前には元の名前のハッシュを付ける ("a b" と "a/b" が同じファイルにならないように)
+    """
+    sample = str(sample)
+    name = re.sub(r'[\\/:*?"<>|\s]+', "_", sample).strip("._")
+    if name and name == sample:
+        return name
+    digest = hashlib.sha1(sample.encode("utf-8")).hexdigest()[:8]
+    return f"{name or 'sample'}-{digest}"
@@ -1,15 +1,33 @@
-import pandas as pd
+import numpy as np
 import os
+import time
 
-def export_to_excel(save_path, tags, x_list, y_list, fit_results_list, atomic_percent):
+import XPSPROF
+from XPSSPEC import as_lists
+
+def export_to_excel(save_path, tags, x_list=None, y_list=None, fit_results_list=None, atomic_percent=None,
+                    streaming=False, include_components=True):
     """
     全データをExcelファイルに出力する関数
     save_path: 保存先のファイルパス (.xlsx)
     tags: タグのリスト
     x_list, y_list: 全データのx, yリスト
     fit_results_list: フィッティング結果の辞書リスト
+    streaming: True の場合は openpyxl の write-only モードで行ごとに書き込む (DataFrameを作らない)
+    include_components: False の場合は各成分 (Comp: ...) の波形列を出力しない
+    tags に XPSSPEC.SpectrumSet を渡す場合は fit_results_list, atomic_percent をキーワードで指定する
     """
-    
+    tags, x_list, y_list = as_lists(tags, x_list, y_list)
+
+    if streaming:
+        return export_to_excel_streaming(save_path, tags, x_list, y_list, fit_results_list, atomic_percent,
+                                         include_components)
+
+    t_start = time.perf_counter() if XPSPROF.enabled else None
+
+    # pandas は読み込みに時間がかかるので、出力するときに初めて読み込む
+    import pandas as pd
+
     # ExcelWriterを使ってファイルを作成
     try:
         with pd.ExcelWriter(save_path, engine='openpyxl') as writer:
@@ -33,7 +51,7 @@ def export_to_excel(save_path, tags, x_list, y_list, fit_results_list, atomic_pe
                     data['Total Fit'] = res['y_total']+res['y_bg']
                     
                     # 各成分 (Component)
-                    for peak in res['peaks']:
+                    for peak in (res['peaks'] if include_components else []):
                         col_name = f"Comp: {peak['name']}"
                         data[col_name] = peak['y_data']+res['y_bg']
 
@@ -88,8 +106,145 @@ def export_to_excel(save_path, tags, x_list, y_list, fit_results_list, atomic_pe
             df_fit_summary.to_excel(writer, sheet_name=summary_sheet_name, startrow=start_row_fit, startcol=0, index=False)
 
         print("Excel出力が完了しました。")
+        if t_start is not None:
+            _profile_workbook(save_path, t_start, streaming=False)
         
     except Exception as e:
         import traceback
         traceback.print_exc()
-        print(f"Excel保存中にエラーが発生しました: {e}")
\ No newline at end of file
+        print(f"Excel保存中にエラーが発生しました: {e}")
+
+
+# 1回に書き込む行数 (メモリ使用量はこの行数分の配列で頭打ちになる)
+STREAM_CHUNK_ROWS = 4096
+
+def export_to_excel_streaming(save_path, tags, x_list, y_list, fit_results_list, atomic_percent,
+                              include_components=True):
+    """
+    export_to_excel と同じレイアウトを write-only ワークブックに行単位で書き込む関数
+    列データはチャンクごとに組み立てるため、測定が大きくてもメモリ使用量が増えない
+    """
+    from openpyxl import Workbook
+
+    t_start = time.perf_counter() if XPSPROF.enabled else None
+    try:
+        wb = Workbook(write_only=True)
+        print(f"\nExcel保存中: {os.path.basename(save_path)} ...")
+
+        for i, tag in enumerate(tags):
+            res = fit_results_list[i]
+            sheet_name = tag[:31]
+            ws = wb.create_sheet(title=sheet_name)
+
+            # 1. 列の定義 (見出し, 配列, バックグラウンドを足すか)
+            columns = [('Binding Energy (eV)', x_list[i], False), ('Raw Intensity', y_list[i], False)]
+            y_bg = None
+            if res is not None:
+                y_bg = np.asarray(res['y_bg'], dtype=float)
+                columns.append(('Background', y_bg, False))
+                columns.append(('Total Fit', res['y_total'], True))
+                if include_components:
+                    for peak in res['peaks']:
+                        columns.append((f"Comp: {peak['name']}", peak['y_data'], True))
+
+            ws.append([c[0] for c in columns])
+
+            # 2. チャンクごとに行を組み立てて書き込む
+            n_rows = len(x_list[i])
+            for start in range(0, n_rows, STREAM_CHUNK_ROWS):
+                end = min(start + STREAM_CHUNK_ROWS, n_rows)
+                block = np.empty((end - start, len(columns)))
+                for k, (_, values, add_bg) in enumerate(columns):
+                    block[:, k] = np.asarray(values[start:end], dtype=float)
+                    if add_bg:
+                        block[:, k] += y_bg[start:end]
+
+                for row in _excel_rows(block):
+                    ws.append(row)
+
+            print(f"  -> Sheet '{sheet_name}' output done.")
+
+        # --- Summaryシート (Atomic % と Fitting Result) ---
+        ws = wb.create_sheet(title="Summary_Result")
+        ws.append(['Element', 'Atomic %'])
+        for i in range(len(tags)):
+            ws.append([tags[i], _excel_value(atomic_percent[i])])
+
+        # export_to_excel と同じく3行空けて Fitting Result を書き込む
+        for _ in range(3):
+            ws.append([])
+
+        fit_header = ['Spectrum', 'Component Name', 'Area Ratio (%)', 'Position (eV)', 'FWHM (eV)', 'Area']
+        rows = []
+        for i, tag in enumerate(tags):
+            res = fit_results_list[i]
+            if res is not None:
+                for peak in res['peaks']:
+                    rows.append([tag, peak['name'], _excel_value(peak['ratio']), _excel_value(peak['center']),
+                                 _excel_value(peak['fwhm']), _excel_value(peak['area'])])
+        if len(rows) > 0:
+            ws.append(fit_header)
+            for row in rows:
+                ws.append(row)
+
+        wb.save(save_path)
+        print("Excel出力が完了しました。")
+        if t_start is not None:
+            _profile_workbook(save_path, t_start, streaming=True)
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        print(f"Excel保存中にエラーが発生しました: {e}")
+
+
+def _profile_workbook(save_path, t_start, streaming):
+    """XPSPROF 有効時: 全体の時間とファイルサイズ、シートごとの書き込みバイト数を記録する"""
+    import zipfile
+    elapsed = time.perf_counter() - t_start
+    try:
+        with zipfile.ZipFile(save_path) as zf:
+            sheets = [(name, zf.getinfo(part)) for name, part in _sheet_parts(zf)]
+    except (KeyError, OSError, ValueError, zipfile.BadZipFile):
+        sheets = []
+
+    XPSPROF.record("excel", elapsed, file=os.path.basename(save_path), streaming=streaming,
+                   bytes=os.path.getsize(save_path), sheets=len(sheets))
+    for name, info in sheets:
+        XPSPROF.record("excel_sheet", sheet=name, bytes=info.compress_size, xml_bytes=info.file_size)
+
+
+def _sheet_parts(zf):
+    """
+    xlsx (zip) 内の (シート名, シートのXMLのパス) をブック内の順に返す
+    パスは xl/workbook.xml のシートの r:id を xl/_rels/workbook.xml.rels で引いて求める
+    (同じタグ・名前の変更があってもシート名とファイルの対応がずれないように)
+    """
+    import posixpath
+    import xml.etree.ElementTree as ET
+    main = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+    rel_id = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+    rels_ns = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+    targets = {}
+    for rel in ET.fromstring(zf.read("xl/_rels/workbook.xml.rels")).iter(rels_ns + "Relationship"):
+        target = rel.get("Target", "")
+        # Target は xl/ からの相対パス (先頭が "/" の場合はパッケージのルートから)
+        targets[rel.get("Id")] = target.lstrip("/") if target.startswith("/") else posixpath.normpath("xl/" + target)
+
+    return [(sheet.get("name"), targets[sheet.get(rel_id)])
+            for sheet in ET.fromstring(zf.read("xl/workbook.xml")).iter(main + "sheet")]
+
+
+def _excel_rows(block):
+    """数値ブロックを行のリストに変換する (NaN/inf はExcelに書けないので空セルにする)"""
+    finite = np.isfinite(block)
+    if finite.all():
+        return block.tolist()
+    rows = block.astype(object)
+    rows[~finite] = None
+    return rows.tolist()
+
+def _excel_value(value):
+    value = float(value)
+    return value if np.isfinite(value) else None
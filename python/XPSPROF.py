@@ -0,0 +1,149 @@
+#計測 (各処理の時間・反復回数・評価回数・書き込み量を記録する。既定では無効)
+#
+# 使い方:
+#   with XPSPROF.profiling() as prof:
+#       ...解析...
+#   report = prof.report()   # または XPSPROF.report()
+# 無効のときは stage() が何もしないコンテキストを返すだけなので、処理への影響はほとんどない
+import contextlib
+import time
+
+# 有効かどうか (各モジュールは `if XPSPROF.enabled:` で記録する)
+enabled = False
+
+# 1回ごとの記録 (最大 MAX_EVENTS 件) と、ステージごとの集計
+MAX_EVENTS = 10000
+_events = []
+_stages = {}
+
+_NULL = contextlib.nullcontext()
+
+
+def enable(reset_records=True):
+    """記録を開始する (reset_records=True の場合はそれまでの記録を消す)"""
+    global enabled
+    if reset_records:
+        reset()
+    enabled = True
+
+
+def disable():
+    """記録を止める (記録済みの内容は report で取得できる)"""
+    global enabled
+    enabled = False
+
+
+def reset():
+    _events.clear()
+    _stages.clear()
+
+
+def stage(name, **fields):
+    """
+    with XPSPROF.stage("fit", tag="C1s") as rec: ... の形で処理時間を記録する
+    rec (辞書) に項目を追加すると同じ記録に含まれる。無効のときは何もしない
+    """
+    if not enabled:
+        return _NULL
+    return _Stage(name, fields)
+
+
+def record(name, elapsed=None, **fields):
+    """1回分の記録を追加する (時間以外の値 (反復回数など) だけでもよい)"""
+    if not enabled:
+        return
+    event = {"stage": name}
+    if elapsed is not None:
+        event["elapsed"] = elapsed
+    event.update(fields)
+    if len(_events) < MAX_EVENTS:
+        _events.append(event)
+
+    agg = _stages.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0, "sums": {}})
+    agg["count"] += 1
+    if elapsed is not None:
+        agg["total"] += elapsed
+        agg["max"] = max(agg["max"], elapsed)
+    # 数値の項目は合計も集計する (nfev, iterations, bytes など)
+    for key, value in fields.items():
+        if isinstance(value, (bool, int, float)):
+            agg["sums"][key] = agg["sums"].get(key, 0) + value
+
+
+def report(include_events=True):
+    """
+    記録をまとめた辞書を返す (JSON にそのまま書き出せる)
+    {"stages": {名前: {"count", "total", "mean", "max", "sums"}}, "events": [...], "dropped": 件数}
+    """
+    stages = {}
+    for name, agg in _stages.items():
+        stages[name] = {
+            "count": agg["count"],
+            "total": agg["total"],
+            "mean": agg["total"] / agg["count"] if agg["count"] else 0.0,
+            "max": agg["max"],
+            "sums": dict(agg["sums"]),
+        }
+    result = {"stages": stages}
+    if include_events:
+        result["events"] = [dict(e) for e in _events]
+        result["dropped"] = max(sum(a["count"] for a in _stages.values()) - len(_events), 0)
+    return result
+
+
+def merge_reports(reports):
+    """複数の report (バッチの各ファイルなど) のステージ集計を1つにまとめる (events は含めない)"""
+    stages = {}
+    for rep in reports:
+        for name, st in (rep or {}).get("stages", {}).items():
+            agg = stages.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0, "sums": {}})
+            agg["count"] += st["count"]
+            agg["total"] += st["total"]
+            agg["max"] = max(agg["max"], st["max"])
+            for key, value in st.get("sums", {}).items():
+                agg["sums"][key] = agg["sums"].get(key, 0) + value
+    for agg in stages.values():
+        agg["mean"] = agg["total"] / agg["count"] if agg["count"] else 0.0
+    return {"stages": stages}
+
+
+def format_report(rep=None):
+    """report を表形式の文字列にする (合計時間の多い順)"""
+    rep = rep or report(include_events=False)
+    lines = [f"{'stage':<22}{'count':>7}{'total ms':>11}{'mean ms':>10}{'max ms':>10}  sums"]
+    for name, st in sorted(rep["stages"].items(), key=lambda kv: -kv[1]["total"]):
+        sums = ", ".join(f"{k}={v}" for k, v in st["sums"].items())
+        lines.append(f"{name:<22}{st['count']:>7}{st['total'] * 1000:>11.1f}{st['mean'] * 1000:>10.2f}"
+                     f"{st['max'] * 1000:>10.2f}  {sums}")
+    return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def profiling(reset_records=True):
+    """with ブロックの間だけ記録を有効にする (このモジュールを返す)"""
+    import sys
+    was_enabled = enabled
+    enable(reset_records)
+    try:
+        yield sys.modules[__name__]
+    finally:
+        if not was_enabled:
+            disable()
+
+
+class _Stage:
+    """stage() が返すコンテキスト (終了時に経過時間と項目を記録する)"""
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = dict(fields)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self.fields
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.fields["error"] = exc_type.__name__
+        record(self.name, time.perf_counter() - self.start, **self.fields)
+        return False
@@ -0,0 +1,199 @@
+#解析セッション (バックグラウンド計算の共有)
+import numpy as np
+
+import XPSCAL
+import XPSFIT
+from XPSCONFIG import index_peaks, index_rsf
+from XPSSPEC import as_lists
+
+
+class AnalysisSession:
+    """
+    1回の解析で使うスペクトル(tags, x_list, y_list)を保持し、
+    Shirleyバックグラウンド・ROI範囲・正味強度を一度だけ計算して
+    atomic_percent とピークフィッティングの両方で使い回すクラス
+    tags には XPSSPEC.SpectrumSet を渡してもよい (x_list, y_list は省略)
+    fit_cache: True または保存先フォルダを指定すると、フィット結果を XPSFITCACHE で再利用する
+    auto_guess: True (既定) の場合、フィッティングの強度の初期値をNNLSで決める (XPSFIT.perform_fitting と同じ)
+                RunAnalysis・XPSBATCH・XPSWORKER もこのクラスを使うので、False で従来の固定の初期値に戻せる
+    fit_roi: True の場合、Shirleyの範囲 (± XPSFIT.ROI_MARGIN) の点だけでフィットする (波形・面積は全点で計算)
+    reduce_points: True の場合、さらに信号の小さい点を間引いてフィットする
+    """
+
+    def __init__(self, tags, x_list=None, y_list=None, fit_cache=None, auto_guess=True, fit_roi=True,
+                 reduce_points=False):
+        tags, x_list, y_list = as_lists(tags, x_list, y_list)
+        self.tags = [str(t) for t in tags]
+        self.x_list = [np.asarray(x, dtype=float) for x in x_list]
+        self.y_list = [np.asarray(y, dtype=float) for y in y_list]
+
+        # (index, パラメータ) -> バックグラウンド計算結果
+        self._backgrounds = {}
+
+        self.auto_guess = bool(auto_guess)
+        self.fit_roi = bool(fit_roi)
+        self.reduce_points = bool(reduce_points)
+
+        # フィット結果キャッシュの保存先 (None: 使わない, "": 既定のフォルダ)
+        if fit_cache is None or fit_cache is False:
+            self.fit_cache_dir = None
+        else:
+            self.fit_cache_dir = "" if fit_cache is True else str(fit_cache)
+
+    def background(self, index, x_min=-1, x_max=-1, **params):
+        """
+        index番目のスペクトルのShirleyバックグラウンドを返す (計算済みなら再利用)
+        戻り値: {"y_bg", "x_min", "x_max", "y_net"} (y_net はマイナスを0にした正味強度)
+        """
+        key = (index, x_min, x_max, tuple(sorted(params.items())))
+        result = self._backgrounds.get(key)
+
+        if result is None:
+            x = self.x_list[index]
+            y = self.y_list[index]
+            y_bg, roi_min, roi_max = XPSCAL.shirley_baseline(x, y, x_min, x_max, **params)
+            result = {
+                "y_bg": y_bg,
+                "x_min": roi_min,
+                "x_max": roi_max,
+                "y_net": np.maximum(y - y_bg, 0.0),
+            }
+            self._backgrounds[key] = result
+
+        return result
+
+    def atomic_percent(self, rsf_list):
+        """XPSCAL.atomic_percent をこのセッションのバックグラウンドで計算する"""
+        return XPSCAL.atomic_percent(self.x_list, self.y_list, self.tags, rsf_list, session=self)
+
+    def fit(self, index, config, verbose=False, initial_params=None, info=None, **limits):
+        """
+        index番目のスペクトルの正味強度に対してピークフィッティングを行う
+        initial_params, info は XPSFIT.perform_fitting と同じ (ウォームスタート / 評価回数の取得)
+        limits: max_nfev, timeout, should_stop (XPSFIT.perform_fitting と同じ。打ち切り用)
+        """
+        bg = self.background(index)
+        options = {"auto_guess": self.auto_guess, "roi": self.fit_window(index), "reduce_points": self.reduce_points}
+        options.update(limits)
+        if self.fit_cache_dir is not None:
+            import XPSFITCACHE
+            return XPSFITCACHE.perform_fitting_cached(self.x_list[index], bg["y_net"], config, verbose,
+                                                      initial_params=initial_params, info=info,
+                                                      cache_dir=self.fit_cache_dir or None, **options)
+        return XPSFIT.perform_fitting(self.x_list[index], bg["y_net"], config, verbose,
+                                      initial_params=initial_params, info=info, **options)
+
+    def fit_window(self, index):
+        """フィッティングに使う ROI (x_min, x_max) (fit_roi=False の場合は None)"""
+        if not self.fit_roi:
+            return None
+        bg = self.background(index)
+        return (float(bg["x_min"]), float(bg["x_max"]))
+
+    def run_analysis(self, rsf_list, peak_db, workers=None):
+        """
+        XpsEngine.RunAnalysis と同じ手順で Atomic % と全タグのピークフィッティングを行う
+        (先頭のSurveyとCuLMMはフィッティング対象外)
+        workers: 2以上を指定すると各領域のフィッティングを XPSFIT.perform_fitting_parallel で並列に行う
+                 (プロセスプールは XPSFIT.get_executor のものを使い回す。止めるときは XPSFIT.shutdown_executor)
+        戻り値: (atomic_percentages, fit_results_list)
+        fit_results_list は export_to_excel に渡せる形式 ({"y_bg", "y_total", "peaks"} または None)
+        rsf_list, peak_db には XPSCONFIG.AnalysisConfig (またはその rsf / peaks の辞書) も渡せる
+        """
+        atomic = self.atomic_percent(rsf_list)
+
+        peaks = index_peaks(peak_db) if peak_db else {}
+        configs = []
+        for i, tag in enumerate(self.tags):
+            config = None
+            if i != 0 and tag != "CuLMM":
+                config = peaks.get(tag) or None
+            configs.append(config)
+
+        if workers is not None and workers > 1:
+            y_nets = [self.background(i)["y_net"] if configs[i] else self.y_list[i] for i in range(len(self.tags))]
+            rois = [self.fit_window(i) if configs[i] else None for i in range(len(self.tags))]
+            if self.fit_cache_dir is not None:
+                fits = self._fit_parallel_cached(y_nets, configs, rois, workers)
+            else:
+                fits = XPSFIT.perform_fitting_parallel(self.x_list, y_nets, configs, workers=workers,
+                                                       auto_guess=self.auto_guess, rois=rois,
+                                                       reduce_points=self.reduce_points)
+        else:
+            fits = [self.fit(i, configs[i]) if configs[i] else (None, None) for i in range(len(self.tags))]
+
+        fit_results_list = []
+        for i, (peaks, y_total) in enumerate(fits):
+            result = None
+            if peaks is not None:
+                result = {"y_bg": self.background(i)["y_bg"], "y_total": y_total, "peaks": peaks}
+            fit_results_list.append(result)
+
+        return atomic, fit_results_list
+
+    def _fit_parallel_cached(self, y_nets, configs, rois, workers):
+        """キャッシュにある領域はそのまま使い、残りだけを並列でフィッティングして保存する"""
+        import XPSFITCACHE
+        cache_dir = self.fit_cache_dir or None
+        fits = [(None, None)] * len(self.tags)
+        keys = [None] * len(self.tags)
+        miss_configs = [None] * len(self.tags)
+        for i, config in enumerate(configs):
+            if not config:
+                continue
+            keys[i] = XPSFITCACHE.fit_cache_key(self.x_list[i], y_nets[i], config, auto_guess=self.auto_guess,
+                                                roi=rois[i], reduce_points=self.reduce_points)
+            hit = XPSFITCACHE.lookup(keys[i], self.x_list[i], cache_dir)
+            if hit is not None:
+                fits[i] = hit
+            else:
+                miss_configs[i] = config
+
+        if any(miss_configs):
+            fitted = XPSFIT.perform_fitting_parallel(self.x_list, y_nets, miss_configs, workers=workers,
+                                                     auto_guess=self.auto_guess, rois=rois,
+                                                     reduce_points=self.reduce_points)
+            for i, config in enumerate(miss_configs):
+                if config and fitted[i][0] is not None:
+                    fits[i] = fitted[i]
+                    XPSFITCACHE.store(keys[i], config, fitted[i][0], cache_dir=cache_dir)
+        return fits
+
+    def clear(self):
+        """計算済みのバックグラウンドを破棄する"""
+        self._backgrounds.clear()
+
+
+def iter_analysis(blocks, rsf_list, peak_db, verbose=False):
+    """
+    run_analysis のストリーミング版 (領域を1つずつ読み込み・解析して結果を順に返すジェネレーター)
+    blocks: (tag, x, y) のイテラブル (XPSASC.iter_allspe など)
+    各領域の結果: {"index", "tag", "x", "y", "norm_area", "fit"}
+      fit は run_analysis の fit_results_list の要素と同じ形式 ({"y_bg", "y_total", "peaks"} または None)
+    1領域分の配列しか保持しないので、全領域の Atomic % は norm_area を集めて
+    XPSCAL.atomic_percent_from_areas で最後に計算する
+    """
+    rsf_dict = index_rsf(rsf_list)
+    peaks = index_peaks(peak_db) if peak_db else {}
+
+    for i, (tag, x, y) in enumerate(blocks):
+        session = AnalysisSession([tag], [x], [y])
+
+        norm_area = 0.0
+        rsf = rsf_dict.get(tag, 0.0)
+        if rsf > 0:
+            bg = session.background(0)
+            raw_area = XPSCAL.Aria(x=session.x_list[0], y=session.y_list[0], baseline_y=bg["y_bg"],
+                                   x_max=bg["x_max"], x_min=bg["x_min"])
+            norm_area = raw_area / rsf
+
+        result = None
+        if i != 0 and tag != "CuLMM":
+            config = peaks.get(tag)
+            if config:
+                fitted_peaks, y_total = session.fit(0, config, verbose)
+                if fitted_peaks is not None:
+                    result = {"y_bg": session.background(0)["y_bg"], "y_total": y_total, "peaks": fitted_peaks}
+
+        yield {"index": i, "tag": tag, "x": session.x_list[0], "y": session.y_list[0],
+               "norm_area": norm_area, "fit": result}
@@ -0,0 +1,84 @@
+#スペクトル集合 (全領域を連続配列で保持するコンテナ)
+import numpy as np
+
+
+class SpectrumSet:
+    """
+    全領域のエネルギー(x)と強度(y)をそれぞれ1本の連続した配列で保持するクラス
+    offsets[i]:offsets[i+1] が i番目の領域 (tags[i]) の範囲
+    領域ごとの x, y はコピーではなくビューなので、帯電補正などは全領域まとめて1回の演算で済む
+    """
+
+    def __init__(self, tags, x, y, offsets):
+        self.tags = [str(t) for t in tags]
+        self.x = np.ascontiguousarray(x, dtype=np.float64)
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+        if len(self.offsets) != len(self.tags) + 1 or self.offsets[-1] != len(self.x) or len(self.x) != len(self.y):
+            raise ValueError("tags, x, y, offsets の長さが一致しません。")
+
+        # タグ -> slice (同じタグが複数ある場合は tags.index と同じく最初のもの)
+        self.index = {}
+        for i, tag in enumerate(self.tags):
+            self.index.setdefault(tag, slice(int(self.offsets[i]), int(self.offsets[i + 1])))
+
+    @classmethod
+    def from_lists(cls, tags, x_list, y_list):
+        """従来の (tags, x_list, y_list) から作成する"""
+        lengths = [len(x) for x in x_list]
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        if len(x_list) == 0:
+            return cls(tags, np.empty(0), np.empty(0), offsets)
+        return cls(tags, np.concatenate(x_list), np.concatenate(y_list), offsets)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __iter__(self):
+        """(tag, x, y) を領域順に返す (x, y はビュー)"""
+        for i, tag in enumerate(self.tags):
+            s, e = self.offsets[i], self.offsets[i + 1]
+            yield tag, self.x[s:e], self.y[s:e]
+
+    def region(self, i):
+        """i番目の領域の (x, y) ビュー"""
+        s, e = self.offsets[i], self.offsets[i + 1]
+        return self.x[s:e], self.y[s:e]
+
+    def get(self, tag):
+        """タグ名で領域の (x, y) ビューを返す (無い場合は None)"""
+        sl = self.index.get(tag)
+        if sl is None:
+            return None
+        return self.x[sl], self.y[sl]
+
+    @property
+    def x_list(self):
+        return [self.x[self.offsets[i]:self.offsets[i + 1]] for i in range(len(self.tags))]
+
+    @property
+    def y_list(self):
+        return [self.y[self.offsets[i]:self.offsets[i + 1]] for i in range(len(self.tags))]
+
+    def to_lists(self):
+        """従来の (tags, x_list, y_list) 形式 (配列はビュー)"""
+        return list(self.tags), self.x_list, self.y_list
+
+    def shift_inplace(self, value):
+        """全領域のエネルギーを value だけずらす (1回のベクトル演算)"""
+        self.x += value
+        return self
+
+    def copy(self):
+        return SpectrumSet(self.tags, self.x.copy(), self.y.copy(), self.offsets.copy())
+
+
+def as_lists(tags, x_list=None, y_list=None):
+    """
+    tags が SpectrumSet の場合は (tags, x_list, y_list) に展開し、それ以外はそのまま返す
+    (各関数で SpectrumSet と従来のリストの両方を受け付けるためのヘルパー)
+    """
+    if isinstance(tags, SpectrumSet):
+        return tags.to_lists()
+    return tags, x_list, y_list
@@ -0,0 +1,304 @@
+#深さ方向分析・時系列のスタック (同じタグのスペクトルを共通のエネルギー軸にそろえ、2次元配列にまとめる)
+#
+# 使い方:
+#   profiles = XPSSTACK.stack_by_tag(spectra)          # {タグ: StackedProfile}
+#   cycles, tags, percent = XPSSTACK.profile_atomic_percent(profiles, rsf_list)
+# intensity は (サイクル数 x 点数) の連続配列なので、バックグラウンド・面積は全サイクルまとめて計算できる
+import hashlib
+import json
+import os
+import time
+import zipfile
+import numpy as np
+
+import XPSCAL
+import XPSPROF
+from XPSCONFIG import index_rsf
+from XPSSPEC import SpectrumSet
+
+
+class StackedProfile:
+    """
+    1つのタグの全サイクルを共通のエネルギー軸 energy に補間した結果
+    intensity[k] が k番目のスペクトル (サイクル番号 cycles[k]、元の領域番号 source[k])
+    """
+
+    def __init__(self, tag, energy, intensity, cycles, source=None):
+        self.tag = str(tag)
+        self.energy = np.ascontiguousarray(energy, dtype=np.float64)
+        self.intensity = np.ascontiguousarray(intensity, dtype=np.float64)
+        self.cycles = np.asarray(cycles, dtype=np.int64)
+        self.source = np.arange(len(self.cycles), dtype=np.int64) if source is None else np.asarray(source, dtype=np.int64)
+
+        if self.intensity.ndim != 2 or self.intensity.shape != (len(self.cycles), len(self.energy)) \
+                or len(self.source) != len(self.cycles):
+            raise ValueError("energy, intensity, cycles, source の大きさが一致しません。")
+
+    def __len__(self):
+        return self.intensity.shape[0]
+
+    @property
+    def shape(self):
+        return self.intensity.shape
+
+    def to_lists(self):
+        """従来の (tags, x_list, y_list) 形式 (x は共通の energy、y は各行のビュー)"""
+        n = len(self)
+        return [self.tag] * n, [self.energy] * n, [self.intensity[k] for k in range(n)]
+
+
+# --- 1. 共通のエネルギー軸と補間 ---
+def common_grid(x_list, points=None, step=None):
+    """
+    全スペクトルに共通する範囲 (最大の下限 ~ 最小の上限) を等間隔に分けたエネルギー軸を返す
+    points / step を省略した場合は各スペクトルの点間隔の中央値を使う
+    向きは先頭のスペクトルに合わせる (通常は結合エネルギーの降順)
+    """
+    if len(x_list) == 0:
+        raise ValueError("スペクトルがありません。")
+
+    lows = np.array([np.min(x) for x in x_list], dtype=float)
+    highs = np.array([np.max(x) for x in x_list], dtype=float)
+    lo, hi = lows.max(), highs.min()
+    if not hi > lo:
+        raise ValueError(f"共通のエネルギー範囲がありません ({lo} - {hi} eV)。")
+
+    if points is None:
+        if step is None:
+            step = float(np.median([np.median(np.abs(np.diff(x))) for x in x_list if len(x) > 1]))
+        points = int(round((hi - lo) / step)) + 1 if step > 0 else 2
+    points = max(int(points), 2)
+
+    grid = np.linspace(lo, hi, points)
+    first = np.asarray(x_list[0])
+    if len(first) > 1 and first[0] > first[-1]:
+        grid = grid[::-1].copy()
+    return grid
+
+
+def interp_rows(x_list, y_list, grid):
+    """
+    各スペクトルを grid 上に線形補間し、(スペクトル数 x len(grid)) の配列を返す
+    行ごとに x をずらして1本につなげ、np.interp を1回だけ呼ぶ
+    (行ごとの np.interp とは、ずらした分の丸め誤差 (1e-12 程度の相対差) の範囲で一致する)
+    範囲外の点はそのスペクトルの端の値 (np.interp と同じ扱い)
+    """
+    grid = np.asarray(grid, dtype=float)
+    n, m = len(y_list), len(grid)
+    if n == 0:
+        return np.empty((0, m))
+
+    descending = m > 1 and grid[0] > grid[-1]
+    g = grid[::-1] if descending else grid
+
+    # 各行を昇順にそろえる
+    xs, ys = [], []
+    for x, y in zip(x_list, y_list):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if len(x) > 1 and x[0] > x[-1]:
+            x, y = x[::-1], y[::-1]
+        xs.append(x)
+        ys.append(y)
+
+    lengths = np.array([len(x) for x in xs], dtype=np.int64)
+    if np.any(lengths == 0):
+        raise ValueError("点の無いスペクトルは補間できません。")
+    lows = np.array([x[0] for x in xs])
+    highs = np.array([x[-1] for x in xs])
+
+    # 行 r を r * width だけずらす (width は全体の幅 + 1 なので、行どうしは重ならない)
+    base = min(lows.min(), g[0])
+    width = max(highs.max(), g[-1]) - base + 1.0
+    shift = np.arange(n) * width
+    x_all = np.concatenate(xs) - base + np.repeat(shift, lengths)
+
+    # 問い合わせ点は各行の範囲に切り詰めてから同じだけずらす (隣の行と補間されないように)
+    query = np.clip(g[None, :], lows[:, None], highs[:, None]) - base + shift[:, None]
+    result = np.interp(query.ravel(), x_all, np.concatenate(ys)).reshape(n, m)
+
+    if descending:
+        result = result[:, ::-1]
+    return np.ascontiguousarray(result)
+
+
+# --- 2. スタック ---
+def stack_profile(spectra, tag, grid=None, points=None, step=None):
+    """
+    spectra (XPSSPEC.SpectrumSet または (tags, x_list, y_list)) のうち tag の全スペクトルをスタックする
+    サイクル番号は XPSCAL.split_groups (同じタグが再び出たら次のサイクル)
+    grid を省略した場合は common_grid(points, step) で決める
+    """
+    return stack_by_tag(spectra, [tag], grid, points, step)[tag]
+
+
+def stack_by_tag(spectra, tags=None, grid=None, points=None, step=None):
+    """
+    タグごとにスタックし、{タグ: StackedProfile} を返す (順序は最初に出てきた順)
+    tags: スタックするタグ (省略時はすべて) / grid: {タグ: エネルギー軸} も指定できる
+    """
+    start = time.perf_counter() if XPSPROF.enabled else None
+    if isinstance(spectra, SpectrumSet):
+        all_tags, x_list, y_list = spectra.to_lists()
+    else:
+        all_tags, x_list, y_list = spectra
+    all_tags = [str(t) for t in all_tags]
+    groups = XPSCAL.split_groups(all_tags)
+
+    order = list(dict.fromkeys(all_tags))
+    if tags is not None:
+        missing = [t for t in tags if t not in order]
+        if missing:
+            raise KeyError(f"タグが見つかりません: {', '.join(missing)}")
+        order = list(tags)
+
+    profiles = {}
+    for tag in order:
+        idx = [i for i, t in enumerate(all_tags) if t == tag]
+        xs = [x_list[i] for i in idx]
+        ys = [y_list[i] for i in idx]
+
+        g = grid.get(tag) if isinstance(grid, dict) else grid
+        if g is None:
+            g = common_grid(xs, points, step)
+        profiles[tag] = StackedProfile(tag, g, interp_rows(xs, ys, g), groups[idx], idx)
+
+    if start is not None:
+        XPSPROF.record("stack", time.perf_counter() - start, tags=len(profiles),
+                       rows=sum(len(p) for p in profiles.values()),
+                       points=sum(p.intensity.size for p in profiles.values()))
+    return profiles
+
+
+# --- 3. スタック全体の計算 ---
+def profile_backgrounds(profile, x_min=-1, x_max=-1, max_iter=50, tol=1e-5):
+    """
+    全行の Shirley バックグラウンド (反復計算は XPSCAL.shirley_iterate_batch で全行同時)
+    戻り値: (y_bg (行数 x 点数), x_mins, x_maxs)
+    """
+    n = len(profile)
+    if n == 0:
+        return np.empty(profile.shape), np.empty(0), np.empty(0)
+    results = XPSCAL.shirley_baseline_batch([profile.energy] * n, list(profile.intensity), x_min, x_max,
+                                            max_iter=max_iter, tol=tol)
+    y_bg = np.vstack([r[0] for r in results])
+    return y_bg, np.array([r[1] for r in results], dtype=float), np.array([r[2] for r in results], dtype=float)
+
+
+def profile_areas(profile, backgrounds=None):
+    """
+    全行の面積 (XPSCAL.Aria と同じ値、丸め誤差の範囲) を配列で返す
+    backgrounds: profile_backgrounds の戻り値 (省略時は計算する)
+    """
+    n, m = profile.shape
+    if n == 0:
+        return np.empty(0)
+    y_bg, x_mins, x_maxs = backgrounds if backgrounds is not None else profile_backgrounds(profile)
+    offsets = np.arange(n + 1, dtype=np.int64) * m
+    return XPSCAL.region_areas_batch(np.tile(profile.energy, n), profile.intensity.ravel(),
+                                     np.asarray(y_bg, dtype=float).ravel(), offsets, x_mins, x_maxs)
+
+
+def profile_atomic_percent(profiles, rsf_list, backgrounds=None):
+    """
+    サイクルごとの原子組成比(%)を計算する
+    profiles: {タグ: StackedProfile} / backgrounds: {タグ: profile_backgrounds の戻り値} (省略可)
+    RSFが無い/0のタグは 0%、そのサイクルに無いタグも 0%
+    戻り値: (cycles (サイクル番号), tags, percent (サイクル数 x タグ数))
+    """
+    rsf_dict = index_rsf(rsf_list)
+    tags = list(profiles)
+    cycles = np.unique(np.concatenate([p.cycles for p in profiles.values()])) if tags else np.empty(0, dtype=np.int64)
+
+    norm = np.zeros((len(cycles), len(tags)))
+    for j, tag in enumerate(tags):
+        rsf = float(rsf_dict.get(tag, 0.0))
+        profile = profiles[tag]
+        if rsf <= 0 or len(profile) == 0:
+            continue
+        bg = backgrounds.get(tag) if backgrounds is not None else None
+        rows = np.searchsorted(cycles, profile.cycles)
+        # 同じサイクルに同じタグが複数ある場合は合計する
+        np.add.at(norm[:, j], rows, profile_areas(profile, bg) / rsf)
+
+    total = norm.sum(axis=1, keepdims=True)
+    percent = np.zeros_like(norm)
+    np.divide(norm * 100, total, out=percent, where=total > 0)
+    return cycles, tags, percent
+
+
+# --- 4. ディスクへの保存 ---
+def save_profiles(path, profiles):
+    """{タグ: StackedProfile} を .npz (非圧縮) に保存する"""
+    arrays = {"tags": np.array(list(profiles), dtype=str)}
+    for k, profile in enumerate(profiles.values()):
+        arrays[f"energy_{k}"] = profile.energy
+        arrays[f"intensity_{k}"] = profile.intensity
+        arrays[f"cycles_{k}"] = profile.cycles
+        arrays[f"source_{k}"] = profile.source
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_profiles(path):
+    """save_profiles で保存したファイルを読み込む (読めない場合は None)"""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return {str(tag): StackedProfile(tag, data[f"energy_{k}"], data[f"intensity_{k}"],
+                                             data[f"cycles_{k}"], data[f"source_{k}"])
+                    for k, tag in enumerate(data["tags"])}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def stack_allspe_cached(path, tags=None, points=None, step=None, shift_setting=None, cache_dir=None,
+                        max_bytes=None):
+    """
+    ASCファイルを読み込んでスタックする (結果は XPSCACHE と同じキャッシュフォルダの stacks に保存)
+    ファイルのサイズ・更新時刻と引数が同じなら保存済みの結果を返す
+    shift_setting: {"XMin", "XMax", "ShiftPeakCenter"} (shift_setting.json と同じ形式)。
+                   指定した場合はスタック前にその設定で XPSCAL.shift の帯電補正を行う (None なら補正しない)
+    """
+    import XPSCACHE
+    max_bytes = XPSCACHE.DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+    folder = os.path.join(XPSCACHE._resolve_cache_dir(cache_dir), "stacks")
+
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        print(f"ファイルを開けません: {e}")
+        return {}
+
+    shift = None
+    if shift_setting is not None:
+        shift = [float(shift_setting.get("XMin", 280.0)), float(shift_setting.get("XMax", 290.0)),
+                 float(shift_setting.get("ShiftPeakCenter", 284.4))]
+
+    options = {"source": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+               "tags": None if tags is None else list(tags), "points": points, "step": step, "shift": shift}
+    key = hashlib.sha1(json.dumps(options, sort_keys=True).encode("utf-8")).hexdigest()
+    stack_path = os.path.join(folder, key + ".npz")
+
+    profiles = load_profiles(stack_path)
+    if profiles is not None:
+        os.utime(stack_path)  # LRU用に最終使用時刻を更新
+        return profiles
+
+    spectra = XPSCACHE.load_allspe_cached(path, as_set=True)
+    if len(spectra) == 0:
+        return {}
+    if shift is not None:
+        spectra = spectra.copy()
+        XPSCAL.shift(spectra, x_min=shift[0], x_max=shift[1], standard=shift[2])
+    profiles = stack_by_tag(spectra, tags, points=points, step=step)
+
+    try:
+        os.makedirs(folder, exist_ok=True)
+        save_profiles(stack_path, profiles)
+        XPSCACHE.evict_cache(cache_dir, max_bytes)  # キャッシュフォルダ全体で上限を共有する
+    except OSError as e:
+        print(f"スタックの保存に失敗しました: {e}")
+    return profiles
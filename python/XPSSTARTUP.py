@@ -0,0 +1,131 @@
+#起動時間の計測 (各モジュールの import 時間を新しいプロセスで測り、予算と比較する)
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# 計測対象のモジュールと予算 (numpy 読み込み後に増える時間, ms)
+IMPORT_BUDGET_MS = {
+    "XPSSPEC": 20,
+    "XPSASC": 30,
+    "XPSCAL": 30,
+    "XPSCACHE": 40,
+    "XPSCONFIG": 20,
+    "XPSPROF": 20,
+    "XPSFIT": 40,
+    "XPSFITCACHE": 50,
+    "XPSSESSION": 50,
+    "XPSSTACK": 50,
+    "XPSOUTPUTXL": 40,
+    "XPSOUTPUTPQ": 40,
+    "XPSBATCH": 80,
+    "XPSWORKER": 80,
+    "XPSJOBS": 60,
+}
+
+# import しただけでは読み込まれてはいけない重い依存
+HEAVY_MODULES = ("scipy", "pandas", "openpyxl", "pyarrow")
+
+# 子プロセスで実行するコード (numpy -> 対象モジュールの順に読み込み、それぞれの時間を出力)
+_PROBE = """
+import json, sys, time
+sys.path.insert(0, {path!r})
+t0 = time.perf_counter()
+import numpy
+t1 = time.perf_counter()
+import {module}
+t2 = time.perf_counter()
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"numpy_ms": (t1 - t0) * 1000, "import_ms": (t2 - t1) * 1000, "heavy": heavy}}))
+"""
+
+# 起動から最初のスペクトル表示まで (読み込み + 帯電補正) を測るコード
+_FIRST_PLOT = """
+import json, sys, time
+sys.path.insert(0, {path!r})
+t0 = time.perf_counter()
+import XPSCACHE, XPSCAL
+t1 = time.perf_counter()
+spectra = XPSCACHE.load_allspe_cached({file!r}, as_set=True).copy()
+t2 = time.perf_counter()
+XPSCAL.shift(spectra, x_min=280.0, x_max=290.0)
+t3 = time.perf_counter()
+print(json.dumps({{"import_ms": (t1 - t0) * 1000, "load_ms": (t2 - t1) * 1000, "shift_ms": (t3 - t2) * 1000,
+                  "total_ms": (t3 - t0) * 1000}}))
+"""
+
+
+def measure_import(module, repeat=3, python=None):
+    """
+    module を新しいプロセスで repeat 回 import し、最も速かった回の結果を返す
+    戻り値: {"module", "numpy_ms", "import_ms", "heavy"}
+    """
+    code = _PROBE.format(path=os.path.dirname(os.path.abspath(__file__)), module=module, heavy=HEAVY_MODULES)
+    best = None
+    for _ in range(repeat):
+        result = _run(code, python)
+        if best is None or result["import_ms"] < best["import_ms"]:
+            best = result
+    best["module"] = module
+    return best
+
+
+def measure_first_plot(file_path, repeat=3, python=None):
+    """起動 → import → 読み込み → 帯電補正 までの時間 (最速の回) を返す"""
+    code = _FIRST_PLOT.format(path=os.path.dirname(os.path.abspath(__file__)), file=os.path.abspath(file_path))
+    results = [_run(code, python) for _ in range(repeat)]
+    return min(results, key=lambda r: r["total_ms"])
+
+
+def check_budget(results, budget=None):
+    """予算を超えた・重い依存を読み込んだモジュールの (module, 理由) のリストを返す"""
+    budget = budget or IMPORT_BUDGET_MS
+    failures = []
+    for res in results:
+        limit = budget.get(res["module"])
+        if limit is not None and res["import_ms"] > limit:
+            failures.append((res["module"], f"{res['import_ms']:.1f} ms > {limit} ms"))
+        if res["heavy"]:
+            failures.append((res["module"], "import 時に読み込み: " + ", ".join(res["heavy"])))
+    return failures
+
+
+def _run(code, python=None):
+    out = subprocess.run([python or sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pythonモジュールの import 時間を計測します")
+    parser.add_argument("modules", nargs="*", help="計測するモジュール (既定: IMPORT_BUDGET_MS の全モジュール)")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="各モジュールの計測回数 (最速の回を採用)")
+    parser.add_argument("--file", default=None, help="指定した場合は最初のスペクトル表示までの時間も計測する")
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    args = parser.parse_args(argv)
+
+    modules = args.modules or list(IMPORT_BUDGET_MS)
+    results = [measure_import(m, args.repeat) for m in modules]
+    failures = check_budget(results)
+    first_plot = measure_first_plot(args.file, args.repeat) if args.file else None
+
+    if args.json:
+        print(json.dumps({"imports": results, "first_plot": first_plot,
+                          "failures": [list(f) for f in failures]}, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'module':<14}{'import ms':>10}{'budget':>8}  heavy")
+        for res in results:
+            limit = IMPORT_BUDGET_MS.get(res["module"], "-")
+            print(f"{res['module']:<14}{res['import_ms']:>10.1f}{limit:>8}  {', '.join(res['heavy'])}")
+        print(f"(numpy: {min(r['numpy_ms'] for r in results):.1f} ms は各モジュールの時間に含まない)")
+        if first_plot is not None:
+            print(f"最初の表示まで: {first_plot['total_ms']:.1f} ms "
+                  f"(import {first_plot['import_ms']:.1f} / 読み込み {first_plot['load_ms']:.1f} / 補正 {first_plot['shift_ms']:.1f})")
+        for module, reason in failures:
+            print(f"予算超過: {module}: {reason}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
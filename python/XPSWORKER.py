@@ -0,0 +1,453 @@
+#常駐ワーカー (モジュール・設定・読み込み済みスペクトルを保持したまま要求を処理する)
+#
+# 通信形式 (stdin/stdout または TCP ソケット, 要求・応答とも同じ形式)
+#   [4バイト: ヘッダー長 (uint32, little endian)] [ヘッダー: UTF-8 JSON] [配列データ (生バイト列を順に連結)]
+#   ヘッダー: {"op": 操作名, "args": {...}, "arrays": [{"name", "dtype", "shape"}, ...]}
+#   応答ヘッダー: {"ok": true/false, "result": {...}, "error": "...", "arrays": [...]}
+# 配列は 1要素ずつではなくバイト列のまま受け渡すので、点数が多くても変換のコストがかからない
+# 1フレームの大きさは MAX_FRAME_BYTES まで (ヘッダーの長さ・配列の大きさを読む前に確認する)
+#
+# TCP の場合は接続ごとに最初の要求で {"op": "hello", "args": {"token": ...}} を送り、トークンが一致した接続だけを受け付ける
+# 待ち受けはループバックアドレスのみ (それ以外は allow_remote / --allow-remote を指定した場合だけ)
+import hmac
+import ipaddress
+import json
+import os
+import secrets
+import socket
+import struct
+import subprocess
+import sys
+import numpy as np
+
+import XPSASC
+import XPSCACHE
+import XPSCAL
+import XPSCONFIG
+from XPSSESSION import AnalysisSession
+from XPSSPEC import SpectrumSet
+
+_HEADER = struct.Struct("<I")
+
+# 1フレーム (ヘッダー + 配列) の上限と、認証前の要求の上限 (バイト)
+MAX_FRAME_BYTES = 1 << 30
+MAX_HELLO_BYTES = 1 << 16
+
+# トークンを渡す環境変数 (serve_socket の token を省略した場合に使う)
+TOKEN_ENV = "XPSUI_WORKER_TOKEN"
+
+
+class FrameError(ValueError):
+    """フレームが不正 (大きすぎる・形式が違う)。以降のデータは読めないので接続を閉じる"""
+
+
+# --- フレームの読み書き ---
+def write_message(stream, header, arrays=None):
+    """ヘッダー(dict) と配列の辞書 (名前 -> ndarray) を1つのフレームとして書き込む"""
+    arrays = arrays or {}
+    payloads = []
+    specs = []
+    for name, value in arrays.items():
+        value = np.ascontiguousarray(value)
+        specs.append({"name": name, "dtype": value.dtype.str, "shape": list(value.shape)})
+        payloads.append(value.tobytes())
+
+    header = dict(header)
+    header["arrays"] = specs
+    body = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    stream.write(_HEADER.pack(len(body)))
+    stream.write(body)
+    for payload in payloads:
+        stream.write(payload)
+    stream.flush()
+
+
+def read_message(stream, max_bytes=MAX_FRAME_BYTES):
+    """
+    1フレームを読み込み (header, arrays) を返す。入力が終わっていれば (None, None)
+    ヘッダー長と配列の合計が max_bytes を超える場合は読み込む前に FrameError
+    """
+    raw = _read_exact(stream, _HEADER.size)
+    if raw is None:
+        return None, None
+    length = _HEADER.unpack(raw)[0]
+    if length > max_bytes:
+        raise FrameError(f"ヘッダーが大きすぎます ({length} バイト)")
+    body = _read_exact(stream, length)
+    if body is None:
+        return None, None
+    try:
+        header = json.loads(body.decode("utf-8"))
+        specs = []
+        for spec in header.get("arrays", []):
+            dtype = np.dtype(spec["dtype"])
+            shape = tuple(int(n) for n in spec["shape"])
+            if dtype.hasobject or any(n < 0 for n in shape):
+                raise ValueError(f"配列 {spec['name']} の形式が不正です")
+            specs.append((spec["name"], dtype, shape, int(np.prod(shape, dtype=np.int64)) * dtype.itemsize))
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise FrameError(f"ヘッダーが不正です: {e}") from e
+    total = length + sum(spec[3] for spec in specs)
+    if total > max_bytes:
+        raise FrameError(f"フレームが大きすぎます ({total} バイト)")
+
+    arrays = {}
+    for name, dtype, shape, nbytes in specs:
+        data = _read_exact(stream, nbytes) if nbytes > 0 else b""
+        if data is None:
+            return None, None
+        arrays[name] = np.frombuffer(data, dtype=dtype).reshape(shape)
+    return header, arrays
+
+
+def _read_exact(stream, n):
+    chunks = []
+    remaining = n
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+# --- ワーカー本体 ---
+class AnalysisWorker:
+    """
+    要求 (op, args, arrays) を処理するクラス
+    読み込んだスペクトル・設定・解析結果はワーカーが終了するまで保持する
+    データは名前 (args["name"], 既定は "default") ごとに別々に持てる
+    """
+
+    def __init__(self, setting_dir=None):
+        self.setting_dir = setting_dir
+        self.rsf_list = []
+        self.peak_db = None
+        self.shift_setting = {}
+        self.data = {}  # 名前 -> {"set": SpectrumSet, "session", "atomic", "fits"}
+
+        if setting_dir is not None:
+            self._load_settings(setting_dir)
+
+    def handle(self, op, args, arrays):
+        """1つの要求を処理して (result, arrays) を返す"""
+        method = getattr(self, "op_" + str(op), None)
+        if method is None:
+            raise ValueError(f"不明な操作です: {op}")
+        return method(args, arrays)
+
+    # --- 各操作 ---
+    def op_ping(self, args, arrays):
+        return {"pid": os.getpid(), "names": sorted(self.data)}, None
+
+    def op_config(self, args, arrays):
+        """設定の読み込み (setting_dir を指定するか、rsf / peakfit / shift_setting を直接渡す)"""
+        if args.get("setting_dir"):
+            self._load_settings(args["setting_dir"])
+        if "rsf" in args:
+            self.rsf_list = args["rsf"]
+            self.setting_dir = None  # 直接渡した設定をファイルで上書きしない
+        if "peakfit" in args:
+            self.peak_db = XPSCONFIG.validate_peaks(args["peakfit"]) if args["peakfit"] is not None else None
+            self.setting_dir = None
+        if "shift_setting" in args:
+            self.shift_setting = args["shift_setting"] or {}
+        return {"rsf": len(XPSCONFIG.index_rsf(self.rsf_list)),
+                "peakfit": sum(len(v) for v in XPSCONFIG.index_peaks(self.peak_db).values())}, None
+
+    def op_load(self, args, arrays):
+        """
+        ASCファイルの読み込み (args: path, cache=True, return_data=True)
+        arrays に x, y, offsets を渡した場合はファイルの代わりにそのデータを使う (args: tags)
+        """
+        if "x" in arrays:
+            spectrum_set = SpectrumSet(args["tags"], arrays["x"], arrays["y"], arrays["offsets"])
+        elif args.get("cache", True):
+            spectrum_set = XPSCACHE.load_allspe_cached(args["path"], as_set=True)
+        else:
+            spectrum_set = XPSASC.load_allspe(args["path"], as_set=True)
+
+        # キャッシュはメモリマップ (コピーオンライト) なので、帯電補正で書き換えられるよう自前の配列にする
+        spectrum_set = spectrum_set.copy()
+        self.data[args.get("name", "default")] = {"set": spectrum_set, "session": None, "atomic": None, "fits": None}
+        return self._spectra_reply(spectrum_set, args.get("return_data", True))
+
+    def op_shift(self, args, arrays):
+        """帯電補正 (args: x_min, x_max, standard。省略時は shift_setting.json の値)"""
+        entry = self._entry(args)
+        spectrum_set = entry["set"]
+        x_min = args.get("x_min", self.shift_setting.get("XMin", 280.0))
+        x_max = args.get("x_max", self.shift_setting.get("XMax", 290.0))
+        standard = args.get("standard", self.shift_setting.get("ShiftPeakCenter", 284.4))
+
+        before = float(spectrum_set.x[0]) if len(spectrum_set.x) > 0 else 0.0
+        shifted = XPSCAL.shift(spectrum_set, x_min=x_min, x_max=x_max, standard=standard)
+        if not isinstance(shifted, tuple):
+            return {"shifted": False, "shift_value": 0.0}, None
+
+        entry["session"] = None
+        entry["atomic"] = None
+        entry["fits"] = None
+        shift_value = float(spectrum_set.x[0]) - before if len(spectrum_set.x) > 0 else 0.0
+        result, out = self._spectra_reply(spectrum_set, args.get("return_data", False))
+        result.update({"shifted": True, "shift_value": shift_value})
+        return result, out
+
+    def op_analyze(self, args, arrays):
+        """
+        Atomic % と全タグのフィッティング (AnalysisSession.run_analysis と同じ)
+        戻り値の arrays: y_bg, y_total (全領域を連結。フィットしていない領域は NaN)
+        """
+        entry = self._entry(args)
+        spectrum_set = entry["set"]
+        if self.setting_dir is not None:
+            self._load_settings(self.setting_dir)  # ファイルが変わっていなければ読み直さない
+        session = AnalysisSession(spectrum_set)
+        atomic, fits = session.run_analysis(self.rsf_list, self.peak_db, workers=args.get("workers"))
+        entry.update({"session": session, "atomic": atomic, "fits": fits})
+
+        n = len(spectrum_set.x)
+        y_bg = np.full(n, np.nan)
+        y_total = np.full(n, np.nan)
+        peaks = []
+        for i, res in enumerate(fits):
+            if res is None:
+                peaks.append(None)
+                continue
+            s, e = spectrum_set.offsets[i], spectrum_set.offsets[i + 1]
+            y_bg[s:e] = res["y_bg"]
+            y_total[s:e] = res["y_total"]
+            peaks.append([
+                {k: (float(p[k]) if k != "name" else p[k]) for k in ("name", "center", "fwhm", "area", "ratio")}
+                for p in res["peaks"]
+            ])
+
+        result = {"atomic_percent": [float(v) for v in atomic], "peaks": peaks}
+        if args.get("return_data", True):
+            return result, {"y_bg": y_bg, "y_total": y_total}
+        return result, None
+
+    def op_export(self, args, arrays):
+        """解析結果の出力 (args: format="excel" / "parquet", save_path または dataset_dir, sample)"""
+        entry = self._entry(args)
+        if entry["fits"] is None:
+            raise ValueError("先に analyze を実行してください。")
+
+        fmt = args.get("format", "excel")
+        include_components = args.get("include_components", True)
+        if fmt == "excel":
+            import XPSOUTPUTXL
+            XPSOUTPUTXL.export_to_excel(args["save_path"], entry["set"], fit_results_list=entry["fits"],
+                                        atomic_percent=entry["atomic"], streaming=args.get("streaming", False),
+                                        include_components=include_components)
+            return {"written": {"excel": args["save_path"]}}, None
+        if fmt == "parquet":
+            import XPSOUTPUTPQ
+            written = XPSOUTPUTPQ.export_to_parquet(args["dataset_dir"], args.get("sample", "sample"), entry["set"],
+                                                    fit_results_list=entry["fits"], atomic_percent=entry["atomic"],
+                                                    include_components=include_components)
+            return {"written": written}, None
+        raise ValueError(f"不明な出力形式です: {fmt}")
+
+    def op_release(self, args, arrays):
+        """保持しているデータを破棄する"""
+        removed = self.data.pop(args.get("name", "default"), None) is not None
+        return {"released": removed}, None
+
+    # --- ヘルパー ---
+    def _entry(self, args):
+        name = args.get("name", "default")
+        entry = self.data.get(name)
+        if entry is None:
+            raise ValueError(f"データ '{name}' が読み込まれていません。")
+        return entry
+
+    def _load_settings(self, setting_dir):
+        self.setting_dir = setting_dir
+        config = XPSCONFIG.get_config(setting_dir=setting_dir)
+        self.rsf_list = config
+        self.peak_db = config if config.peak_db is not None else None
+        self.shift_setting = XPSCONFIG.get_shift_setting(setting_dir)
+
+    @staticmethod
+    def _spectra_reply(spectrum_set, return_data):
+        result = {"tags": list(spectrum_set.tags), "offsets": spectrum_set.offsets.tolist()}
+        if return_data:
+            return result, {"x": spectrum_set.x, "y": spectrum_set.y}
+        return result, None
+
+
+def serve(reader, writer, worker=None, token=None):
+    """
+    reader / writer (バイナリストリーム) から要求を読み、応答を書き込むループ
+    op が "shutdown" の要求 (戻り値 True)、または入力の終わり・不正なフレーム・認証の失敗 (戻り値 False) で終了する
+    token: 指定した場合、最初の要求が {"op": "hello", "args": {"token": token}} でなければ終了する
+    """
+    worker = worker or AnalysisWorker()
+    if token is not None and not _handshake(reader, writer, token):
+        return False
+    while True:
+        try:
+            header, arrays = read_message(reader)
+        except FrameError as e:
+            write_message(writer, {"ok": False, "error": f"{type(e).__name__}: {e}"})
+            return False
+        if header is None:
+            return False
+        op = header.get("op")
+        if op == "shutdown":
+            write_message(writer, {"ok": True, "result": {}})
+            return True
+
+        try:
+            result, out = worker.handle(op, header.get("args") or {}, arrays)
+            write_message(writer, {"ok": True, "result": result}, out)
+        except Exception as e:
+            write_message(writer, {"ok": False, "error": f"{type(e).__name__}: {e}"})
+
+
+def _handshake(reader, writer, token):
+    """最初の要求でトークンを確認する (一致すれば True。認証前は MAX_HELLO_BYTES より大きいフレームを読まない)"""
+    try:
+        header, _ = read_message(reader, max_bytes=MAX_HELLO_BYTES)
+    except FrameError:
+        header = None
+    if header is None:
+        return False
+    given = (header.get("args") or {}).get("token") if header.get("op") == "hello" else None
+    if not isinstance(given, str) or not hmac.compare_digest(given.encode("utf-8"), token.encode("utf-8")):
+        write_message(writer, {"ok": False, "error": "認証に失敗しました。"})
+        return False
+    write_message(writer, {"ok": True, "result": {"pid": os.getpid()}})
+    return True
+
+
+def is_loopback(host):
+    """host がループバックアドレス (127.0.0.1, localhost など) か"""
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def serve_stdio(setting_dir=None):
+    """stdin/stdout で要求を処理する (各関数の print は stderr に回す)"""
+    reader = sys.stdin.buffer
+    writer = sys.stdout.buffer
+    sys.stdout = sys.stderr
+    try:
+        serve(reader, writer, AnalysisWorker(setting_dir))
+    finally:
+        _shutdown_pool()
+
+
+def serve_socket(host="127.0.0.1", port=0, setting_dir=None, token=None, allow_remote=False):
+    """
+    TCPソケットで要求を処理する (1接続ずつ順に受け付ける。状態は接続をまたいで保持し、shutdown で終了)
+    port=0 の場合は空いているポートを使い、"PORT <番号>" を stdout に出力する
+    token: 接続ごとに hello で確認する共有トークン (省略時は環境変数 XPSUI_WORKER_TOKEN、
+           それも無ければ生成して "TOKEN <トークン>" を stdout に出力する)
+    allow_remote: True の場合だけループバック以外のアドレスで待ち受けられる
+    """
+    if not allow_remote and not is_loopback(host):
+        raise ValueError(f"ループバック以外のアドレスでは待ち受けできません: {host} (allow_remote を指定してください)")
+    token = token or os.environ.get(TOKEN_ENV)
+    generated = not token
+    if generated:
+        token = secrets.token_hex(16)
+
+    worker = AnalysisWorker(setting_dir)
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            server.bind((host, port))
+            server.listen(1)
+            print(f"PORT {server.getsockname()[1]}", flush=True)
+            if generated:
+                print(f"TOKEN {token}", flush=True)
+            while True:
+                conn, _ = server.accept()
+                try:
+                    with conn, conn.makefile("rb") as reader, conn.makefile("wb") as writer:
+                        if serve(reader, writer, worker, token):
+                            break
+                except OSError as e:
+                    # 相手が途中で切断した場合などは次の接続を待つ
+                    print(f"接続を閉じました: {e}", file=sys.stderr)
+    finally:
+        _shutdown_pool()
+
+
+def _shutdown_pool():
+    """並列フィッティング (analyze の workers) で起動したプロセスプールを止める"""
+    if "XPSFIT" in sys.modules:
+        sys.modules["XPSFIT"].shutdown_executor()
+
+
+# --- クライアント ---
+class WorkerClient:
+    """
+    常駐ワーカーをサブプロセスとして起動し、要求を送るクライアント
+    例:
+        with WorkerClient(setting_dir) as client:
+            client.request("load", {"path": "a.asc"})
+            client.request("shift")
+            result, arrays = client.request("analyze")
+    """
+
+    def __init__(self, setting_dir=None, python=None):
+        cmd = [python or sys.executable, os.path.abspath(__file__)]
+        if setting_dir is not None:
+            cmd += ["--setting-dir", setting_dir]
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    def request(self, op, args=None, arrays=None):
+        """要求を送って (result, arrays) を返す (ワーカー側のエラーは RuntimeError)"""
+        write_message(self.process.stdin, {"op": op, "args": args or {}}, arrays)
+        header, out = read_message(self.process.stdout)
+        if header is None:
+            raise RuntimeError("ワーカーが終了しました。")
+        if not header.get("ok"):
+            raise RuntimeError(header.get("error"))
+        return header.get("result"), out
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.request("shutdown")
+            except (RuntimeError, OSError):
+                pass
+            self.process.stdin.close()
+            self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="XPS解析の常駐ワーカー")
+    parser.add_argument("--setting-dir", default=None, help="RSF.json / peakfit.json / shift_setting.json のフォルダ")
+    parser.add_argument("--port", type=int, default=None, help="指定した場合は stdin/stdout の代わりにTCPで待ち受ける (0で自動)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--allow-remote", action="store_true",
+                        help="ループバック以外のアドレスでの待ち受けを許可する (トークンは環境変数 XPSUI_WORKER_TOKEN で渡す)")
+    args = parser.parse_args(argv)
+
+    if args.port is None:
+        serve_stdio(args.setting_dir)
+    else:
+        try:
+            serve_socket(args.host, args.port, args.setting_dir, allow_remote=args.allow_remote)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
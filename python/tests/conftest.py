@@ -0,0 +1,5 @@
+# python/ 直下のモジュール (XPSCONFIG など) をテストから import できるようにする
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
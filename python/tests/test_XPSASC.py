@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+import XPSASC
+
+WELL_FORMED = "Su1s\n1\n510.0,1302.5\n509.9,1297.3\n509.8,1312.8\n\nC1s\n1\n290.0,10.5\n289.9,11.0\n289.8,12.25\n"
+# 空の列・数値でない列を含む行 (従来パーサーはその行だけを読み飛ばす)
+MALFORMED = [
+    "C1s\n1\n1, \n3,4\n",
+    "C1s\n1\n1,2\n,4\n5,6\n",
+    "C1s\n1\n1,2\n3, ,\n5,6\n",
+    "C1s\n1\n1,2\n \t,4\n5,\t\n7,8\n",
+    "C1s\n1\n1,2\nabc,4\n5,6\n\nO1s\n1\n531,7\n530,\n",
+]
+
+
+def _assert_same(result, expected):
+    tags, x_list, y_list = result
+    assert tags == expected[0]
+    assert len(x_list) == len(expected[1])
+    for x, y, ex, ey in zip(x_list, y_list, expected[1], expected[2]):
+        np.testing.assert_array_equal(x, ex)
+        np.testing.assert_array_equal(y, ey)
+
+
+@pytest.mark.parametrize("text", [WELL_FORMED] + MALFORMED)
+def test_fast_parser_matches_csv(tmp_path, text):
+    path = tmp_path / "sample.asc"
+    path.write_text(text, encoding="utf-8")
+    expected = XPSASC.load_allspe_csv(str(path))
+
+    _assert_same(XPSASC.load_allspe_fast(str(path)), expected)
+    _assert_same(XPSASC.load_allspe(str(path)), expected)
+    streamed = list(XPSASC.iter_allspe(str(path)))
+    _assert_same(([t for t, _, _ in streamed], [x for _, x, _ in streamed], [y for _, _, y in streamed]), expected)
+
+
+def test_empty_field_is_not_read_as_minus_one(tmp_path):
+    path = tmp_path / "sample.asc"
+    path.write_text(MALFORMED[0], encoding="utf-8")
+
+    tags, x_list, y_list = XPSASC.load_allspe(str(path))
+    assert tags == ["C1s"]
+    np.testing.assert_array_equal(x_list[0], [3.0])
+    np.testing.assert_array_equal(y_list[0], [4.0])
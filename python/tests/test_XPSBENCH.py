@@ -0,0 +1,22 @@
+import XPSASC
+import XPSBENCH
+from XPSSESSION import AnalysisSession
+
+
+def test_synthetic_fit_areas_are_nonzero(tmp_path):
+    path = str(tmp_path / "synthetic.asc")
+    info = XPSBENCH.generate_asc(path, n_regions=3, points=400, peaks=2)
+    rsf_list, peak_db = XPSBENCH.make_settings(info)
+    tags, x_list, y_list = XPSASC.load_allspe(path)
+
+    atomic, fits = AnalysisSession(tags, x_list, y_list).run_analysis(rsf_list, peak_db)
+
+    XPSBENCH.check_results(atomic, fits)
+    for res in fits[1:]:
+        assert all(p["area"] > 0 for p in res["peaks"])
+    assert abs(sum(atomic) - 100.0) < 1e-6
+
+
+def test_small_benchmark_runs():
+    report = XPSBENCH.benchmark(n_regions=3, points=300, scenarios=("fit", "pipeline"), repeat=1)
+    assert set(report["results"]) == {"fit", "pipeline"}
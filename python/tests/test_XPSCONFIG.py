@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+
+import XPSCONFIG
+import XPSFIT
+
+# PeakFitEditor.PeakFitItem を JsonSerializer (WriteIndented) で保存したときと同じ形式
+EDITOR_PEAKFIT = [
+    {"id": "1", "level": "C1s", "name": "C-C", "center": 284.8, "center_error": 0.5, "FWHM": 1.0, "FWHM_error": 0.3},
+    {"id": "2", "level": "C1s", "name": "C-O", "center": 286.3, "center_error": 0.8, "FWHM": 1.2, "FWHM_error": 0.4},
+    {"id": "3", "level": "O1s", "name": "O-H", "center": 531.5, "center_error": 0.8, "FWHM": 1.3, "FWHM_error": 0.4},
+]
+RSF = [{"level": "C1s", "rsf": 1.0}, {"level": "O1s", "rsf": 2.93}]
+
+
+def _write_settings(tmp_path, peakfit):
+    (tmp_path / "RSF.json").write_text(json.dumps(RSF), encoding="utf-8")
+    # C#側は UTF-8 (BOM付きの場合もある) で書き出す
+    (tmp_path / "peakfit.json").write_text(json.dumps(peakfit, indent=2), encoding="utf-8-sig")
+    XPSCONFIG.clear_registry()
+    return XPSCONFIG.get_config(setting_dir=str(tmp_path))
+
+
+def test_editor_format_is_loaded(tmp_path):
+    config = _write_settings(tmp_path, EDITOR_PEAKFIT)
+
+    assert config.has_peak_db
+    assert len(config.peak_db) == len(EDITOR_PEAKFIT)
+    c1s = config.peaks_for("C1s")
+    assert [p["name"] for p in c1s] == ["C-C", "C-O"]
+    assert c1s[0]["position"] == 284.8 and c1s[0]["fwhm"] == 1.0
+    assert c1s[1]["position_error"] == 0.8 and c1s[1]["fwhm_error"] == 0.4
+    assert len(config.peaks_for("O1s")) == 1
+
+
+def test_editor_errors_are_fit_bounds(tmp_path):
+    config = _write_settings(tmp_path, EDITOR_PEAKFIT)
+    c1s = config.peaks_for("C1s")
+
+    pos, pos_min, pos_max, fwhm, fwhm_min, fwhm_max = XPSFIT.peak_limits(c1s[1])
+    assert (pos, fwhm) == (286.3, 1.2)
+    assert np.isclose(pos_min, 285.5) and np.isclose(pos_max, 287.1)
+    assert np.isclose(fwhm_min, 0.8) and np.isclose(fwhm_max, 1.6)
+
+    # 設定位置から 0.6 eV ずれたピークも center_error (0.8 eV) の範囲内なので追従できる
+    x = np.linspace(292.0, 280.0, 600)
+    y = 1000.0 * XPSFIT.pseudo_voigt(x, 1.0, 284.8, 1.0, 0.3) + 400.0 * XPSFIT.pseudo_voigt(x, 1.0, 286.9, 1.2, 0.3)
+    fitted, y_total = XPSFIT.perform_fitting(x, y, c1s)
+    assert fitted is not None
+    assert abs(fitted[1]["center"] - 286.9) < 0.05
+    for peak, conf in zip(fitted, c1s):
+        assert abs(peak["center"] - conf["center"]) <= conf["center_error"] + 1e-9
+
+
+def test_invalid_entries_are_dropped(tmp_path):
+    peakfit = EDITOR_PEAKFIT + [{"id": "4", "level": "C1s", "name": "bad", "center": 288.0, "FWHM": 0.0},
+                                {"id": "5", "level": "C1s", "name": "no-center", "FWHM": 1.0}]
+    config = _write_settings(tmp_path, peakfit)
+
+    assert [p["name"] for p in config.peaks_for("C1s")] == ["C-C", "C-O"]